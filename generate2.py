@@ -1,72 +1,338 @@
+import argparse
+import contextvars
+import cProfile
+from collections.abc import Iterator
+from contextlib import ExitStack
+from pathlib import Path
 from time import time
+from typing import Any
 
 from src import models
-from src.app import config, create_app
+from src.app import config, create_app, current_app, get_arguments, get_options, get_renderer
 from src.core import helpers
+from src.core.assets import remove_stray_files
+from src.core.cache import create_render_cache, precompile_templates
+from src.core.discovery import discover_posts
+from src.core.fingerprint import assets_changed
+from src.core.images import images_changed, sync_images
+from src.core.indexes import (
+    all_index_pages,
+    output_to_url,
+    post_signatures,
+    render_index,
+    save_index_pages,
+)
+from src.core.manifest import (
+    Manifest,
+    build_fingerprint,
+    build_inputs,
+    link_posts,
+    page_templates,
+    stale_posts,
+    write_output,
+)
+from src.core.minify import compressed_siblings
+from src.core.pool import render_posts
+from src.core.profiler import PROFILER, Profiler, current_profiler
+from src.core.search import SearchIndex, search_settings
+from src.core.sitemap import save_sitemap
+from src.core.writer import OutputWriter
 
 
 def main() -> None:
+    args = get_arguments()
+
+    # Every config is built as a site of its own, with the rest of the arguments
+    sites = [argparse.Namespace(**vars(args) | {"config": c}) for c in args.config]
+    if len(sites) > 1:
+        for i, site in enumerate(sites, start=1):
+            site.profile = numbered(site.profile, i)
+            site.cprofile = numbered(site.cprofile, i)
+    build_sites(sites, threads=args.site_threads)
+
+
+def numbered(path: Path | None, number: int, /) -> Path | None:
+    """Number a file to save for one of several sites, so they don't overwrite each other."""
+    return path and path.with_name(f"{path.stem}-{number}{path.suffix}")
+
+
+def build(config_file: str | Path, /, **options: Any) -> None:
+    """Build the site of a config file.
+
+    The options are the same as the command-line arguments, named like `minify` or `jobs`.
+    The site is built in a context of its own, leaving the one it's called from untouched.
+    """
+    contextvars.Context().run(build_site, get_options(config_file, **options))
+
+
+def build_sites(sites: list[argparse.Namespace], /, threads: int = 1) -> None:
+    """Build several sites in this process, some number of them at the same time.
+
+    Each site is built in a context of its own, with its own config and app.
+    The renderers that don't depend on the config are shared between them.
+    """
+    if len(sites) > 1 and any(site.watch for site in sites):
+        raise RuntimeError("Only a single site can be watched at a time")
+
+    # Sites can't share where their files go, or they'd overwrite each other's
+    seen: dict[Path, int] = {}
+    for i, site in enumerate(sites):
+        directories = config.load(site.config)["directories"]
+        for path in {directories["output_dir"].resolve(), directories["cache"].resolve()}:
+            if (other := seen.setdefault(path, i)) != i:
+                raise RuntimeError(f"Sites {sites[other].config} and {site.config} both use {path}")
+
+    if threads <= 1 or len(sites) <= 1:
+        for site in sites:
+            contextvars.Context().run(build_site, site)
+        return
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        futures = [executor.submit(contextvars.Context().run, build_site, site) for site in sites]
+    for future in futures:
+        future.result()
+
+
+def build_site(args: argparse.Namespace, /) -> None:
+    """Build the site of a single config, along with everything asked of it."""
     # Get the current time for a bit of info about runtime
     start_time = time()
+    PROFILER.set(Profiler())
+    profiler = current_profiler()
 
     # Create an instance of the generator app
-    create_app()
+    with profiler.stage("config"):
+        create_app(args)
+
+    # If requested, profile everything this process does from here on out
+    if config.get("cprofile"):
+        cprofile = cProfile.Profile()
+        cprofile.enable()
+
+    # Generate the whole site, or only point out what generating it would change
+    if config.get("plan"):
+        from src.core.plan import make_plan
+
+        with profiler.stage("plan"):
+            make_plan().print_report()
+    else:
+        prepare_site()
+        render_site()
+
+    if config.get("cprofile"):
+        cprofile.disable()
+        cprofile.dump_stats(config.get("cprofile"))
+
+    # Provide a basic "how long did it run" message, and a much more detailed one if requested
+    print(f"Total generation time for {args.config}: {helpers.duration(time() - start_time)}")
+    if config.get("profile"):
+        profiler.print_report(config.get("profile_slowest"))
+        profiler.save(config.get("profile"), config.get("profile_slowest"))
+
+    # Keep the site up to date while it's being worked on
+    if config.get("watch") and not config.get("plan"):
+        from src.core.serve import serve
+
+        serve(render_site)
+
+
+def prepare_site() -> None:
+    """Get the output directory and caches ready for rendering the site."""
+    profiler = current_profiler()
 
     # Create all of the directories that we need for dist
-    helpers.make_dist()
+    with profiler.stage("make_dist"):
+        helpers.make_dist()
 
-    # Find all markdown files in the posts directory
-    all_posts: dict[str, models.Post] = {
-        file.name: models.Post(file) for file in config.get("directories")["posts"].glob("*.md")
-    }
+    # Start over with rendering everything if requested
+    if config.get("clear_cache"):
+        create_render_cache().clear()
+        if (bytecode_cache := get_renderer("jinja").bytecode_cache) is not None:
+            bytecode_cache.clear()
 
-    # Sort all of the posts, with the newest on top
-    all_posts = {
-        k: v for k, v in sorted(all_posts.items(), key=lambda x: x[1].meta["date"], reverse=True)
-    }
+    # Compiling the whole theme now saves the next builds from doing it
+    if config.get("precompile_templates"):
+        with profiler.stage("templates"):
+            print(f"Templates: {precompile_templates()} compiled")
+
+
+def render_site() -> None:
+    """Render and save all of the posts, pages, and feeds.
 
-    # Create a mapping between each post and it's final url
-    post_url_mapping = {
-        post_model.file.name: post_model.meta["url"] for post_model in all_posts.values()
+    Whatever is spread across processes shares a single pool of them,
+    which is shut down however rendering ends.
+    """
+    with ExitStack() as stack:
+        render_outputs(stack)
+
+
+def render_outputs(stack: ExitStack, /) -> None:
+    """Render and save everything, keeping what needs to be shut down afterwards on the `stack`."""
+    app = current_app()
+    profiler = current_profiler()
+    incremental: bool = config.get("incremental")
+    low_memory: bool = config.get("low_memory")
+
+    # Load what the previous build produced. A full build starts from scratch,
+    # but still records a manifest so the next build can be an incremental one
+    manifest_path = config.get("directories")["cache"] / "manifest.json"
+    inputs = build_inputs()
+    fingerprint = build_fingerprint(inputs)
+    app["build"] = {
+        "manifest": Manifest.load(manifest_path, fingerprint=fingerprint)
+        if incremental
+        else Manifest(manifest_path, fingerprint=fingerprint),
+        "render_cache": create_render_cache(),
+        "writer": OutputWriter(threads=config.get("write_threads")),
+        "asset_urls": {},
+        "exit_stack": stack,
     }
+    manifest: Manifest = app["build"]["manifest"]
 
-    # Render, generate, and save to disk each individual post
-    for post_model in all_posts.values():
-        # We provide the raw file name -> url mapping to allow internal blog links to be generated
-        post_model.from_markdown(post_model.meta | {"all_urls": post_url_mapping})
+    # Every output is written again when the formats to precompress in change,
+    # but the ones in formats that are no longer asked for need removing
+    if incremental and manifest.inputs.get("config precompress") != inputs["config precompress"]:
+        manifest.remove_unwanted_compression()
 
-        # All post data is namespaced to make the source of the data clear at all times
-        ctx = {"post": {"meta": post_model.meta, "content": post_model.content}}
+    # Copy every static file to a name with its content hash in it, for templates to link to
+    asset_urls: dict[str, str] = {}
+    asset_outputs: set[Path] = set()
+    if config.get("fingerprint_assets"):
+        from src.core.fingerprint import fingerprint_assets
+
+        with profiler.stage("fingerprint"):
+            asset_urls, asset_outputs = fingerprint_assets()
+    app["build"]["asset_urls"] = asset_urls
+
+    # Resize every image that changed since the last build, for posts to show
+    image_index: dict[str, dict] = {}
+    image_outputs: set[Path] = set()
+    if config.get("responsive_images"):
+        with profiler.stage("images"):
+            image_index, image_outputs = sync_images(jobs=config.get("jobs"))
+    app["build"]["image_index"] = image_index
+
+    # Find every post to publish in the posts directory
+    with profiler.stage("discovery"):
+        post_files = discover_posts()
+
+    # Read every post, newest first, fingerprinting what it's made of
+    all_posts, sources = models.read_posts(post_files, manifest=manifest, low_memory=low_memory)
+
+    # Create a mapping between each post and it's final url, and find every
+    # post that links to a post that moved since the last build
+    link_index, moved = link_posts(all_posts, manifest=manifest)
+
+    # The feeds need the content of their posts, even when keeping memory use down
+    keep_content = set()
+    if config.get("feed") and low_memory:
+        from src.core.feed import feed_settings
+
+        keep_content = set(tuple(all_posts)[: feed_settings()["items"]])
+
+    # Work out which posts need to be rendered. If nothing about a post has changed
+    # since the last build, reuse what it rendered to instead of rendering it again
+    app["build"]["link_index"] = link_index
+    content_hashes: dict[str, str] = {}
+    stale = (
+        stale_posts(
+            list(all_posts),
+            sources=sources,
+            manifest=manifest,
+            moved=moved,
+            images_changed=lambda used: images_changed(used, image_index),
+            assets_changed=lambda used: assets_changed(used, asset_urls),
+        )
+        if incremental
+        else dict.fromkeys(all_posts, "full build")
+    )
+    for name, post_model in all_posts.items():
+        if name in stale:
+            continue
+
+        content_hashes[name] = manifest.posts[name]["rendered"]
+        if not low_memory or name in keep_content:
+            post_model.content = manifest.load_post(name)
+
+    # Render, generate, and save to disk each individual post
+    for post_model, references, page, post_profiler in render_posts(
+        (all_posts[name] for name in stale), jobs=config.get("jobs")
+    ):
+        # Posts rendered in another process come back as a copy
+        name = post_model.file.name
+        all_posts[name] = post_model
+        profiler.merge(post_profiler, post=name)
+        link_index.add(name, references["links"])
 
         # Construct the proper output path for this post and save it to disk
-        post_model.to_file(
+        output_path = (
             config.get("directories")["output_dir"]
             / config.get("post")["output_dir"]
-            / f"{post_model.meta['slug']}.html",
-            post_model.to_html(ctx),
+            / f"{post_model.meta.slug}.html"
+        )
+        with profiler.post(name), profiler.stage("write"):
+            write_output(output_path, page)
+
+        # Keep track of what went into this post for the next build
+        manifest.record_post(
+            name,
+            source=sources[name],
+            links=references["links"],
+            images=references["images"],
+            assets=references["assets"],
+            url=post_model.meta.url,
+            stats=post_model.meta.stats,
+            cost=round(sum(profiler.posts.get(name, {}).values()), 6),
+            output=output_path.relative_to(config.get("directories")["output_dir"]).as_posix(),
+            content=post_model.content,
         )
 
+        # We're done with this post's content, unless it's needed for the feeds
+        content_hashes[name] = manifest.posts[name]["rendered"]
+        if low_memory and name not in keep_content:
+            post_model.content = ""
+
+    # Clean up after any post that has since been removed
+    manifest.prune(set(all_posts))
+
+    # Point out every link to a post that doesn't exist
+    broken_links = link_index.save_report(config.get("directories")["cache"] / "links.json")
+    for post_name, href in broken_links:
+        print(f"Broken link: {post_name} -> {href}")
+
     # Create the post index, listing all the posts, saving it in the proper place
-    # depending on the author's decision to have a distinct home page
-    post_index = models.PostIndex(config.get("directories")["theme"])
-    post_index_output_dir = (
-        config.get("directories")["output_dir"] / config.get("post")["output_dir"]
-        if "home_template" in config.get("site")["pages"]
-        else config.get("directories")["output_dir"]
-    )
+    # depending on the author's decision to have a distinct home page.
+    # If requested, split it into pages, and create a post index for each tag too
+    chains = page_templates()
+    signatures = post_signatures(all_posts.values(), content_hashes=content_hashes)
 
-    post_index.to_file(
-        post_index_output_dir / "index.html", post_index.to_html({"posts": all_posts.values()})
-    )
+    def render_index_pages() -> Iterator[tuple[str, str | None]]:
+        page_models = {"index": models.PostIndex(config.get("directories")["theme"])}
+        if "tag_template" in config.get("post"):
+            page_models["tag"] = models.TagIndex(config.get("directories")["theme"])
+        for kind, ctx in all_index_pages(list(all_posts.values())):
+            yield render_index(
+                page_models[kind], ctx, templates=chains[kind], signatures=signatures
+            )
+
+    # The pages are minified in batches, spread across processes like the posts
+    page_outputs = save_index_pages(render_index_pages(), jobs=config.get("jobs"))
+    index_outputs = set(page_outputs)
 
-    # If a distinct site homepage has been defined, generate it too
+    # If a distinct site homepage has been defined, generate it too.
+    # The site pages are rendered every time, but the static files they link to
+    # are still recorded, so a plan can point out when they change
     if "home_template" in config.get("site")["pages"]:
         site_index = models.Page(
             file=config.get("directories")["theme"], template_key="home_template"
         )
-        site_index.to_file(
-            config.get("directories")["output_dir"] / "index.html", site_index.to_html()
-        )
+        with helpers.record_assets() as assets:
+            html = site_index.to_html()
+        manifest.page_assets["index.html"] = assets
+        site_index.to_file(config.get("directories")["output_dir"] / "index.html", html)
+        index_outputs.add("index.html")
 
     # Generate all defined pages
     for k, v in config.get("site")["pages"].items():
@@ -75,24 +341,60 @@ def main() -> None:
             continue
 
         site_page = models.Page(config.get("directories")["theme"], template_key=k)
-        site_page.to_file(
-            config.get("directories")["output_dir"] / v.replace(".jinja2", ".html"),
-            site_page.to_html(),
-        )
+        key = v.replace(".jinja2", ".html")
+        with helpers.record_assets() as assets:
+            html = site_page.to_html()
+        manifest.page_assets[key] = assets
+        site_page.to_file(config.get("directories")["output_dir"] / key, html)
+        index_outputs.add(key)
 
     # If we want to generate feeds, do so
     if config.get("feed"):
-        from src.core.feed import generate_json_feed, generate_rss_feed
+        from src.core.feed import save_feeds
 
-        (config.get("directories")["output_dir"] / "feed.json").write_text(
-            generate_json_feed(all_posts)
-        )
-        (config.get("directories")["output_dir"] / "feed.xml").write_bytes(
-            generate_rss_feed(all_posts)
-        )
+        with profiler.stage("feeds"):
+            index_outputs |= save_feeds(all_posts, content_hashes=content_hashes)
+
+    # Let search engines find every post and index page
+    with profiler.stage("sitemap"):
+        sitemap_urls = {p.meta.url: p.meta.date for p in all_posts.values()}
+        sitemap_urls |= {output_to_url(k): None for k in page_outputs}
+        if "home_template" in config.get("site")["pages"]:
+            sitemap_urls["/"] = None
+        index_outputs |= save_sitemap(sitemap_urls)
+
+    # Let readers search every post, updating only what changed since the last build
+    if config.get("search_index"):
+        with profiler.stage("search"):
+            search_index = SearchIndex.load(
+                config.get("directories")["cache"] / "search.json", settings=search_settings()
+            )
+            for name, post_model in all_posts.items():
+                search_index.update(name, post_model, rendered=content_hashes[name])
+            search_index.prune(set(all_posts))
+            index_outputs |= search_index.save_outputs(everything=not incremental)
+            search_index.save()
+
+    # Clean up any index page, feed, or search shard that is no longer needed
+    manifest.prune_pages(index_outputs)
+
+    # Make sure everything has been written before recording what this build produced
+    # so the next one can build on top of it, and keep the render cache from growing without bounds
+    with profiler.stage("write"):
+        app["build"]["writer"].close()
+
+    # Along with what it was all rendered with, so a plan can point out what changed since
+    manifest.inputs = inputs
+    manifest.templates = {k: v for chain in chains.values() for k, v in chain.items()}
+    manifest.save()
 
-    # Provide a basic "how long did it run" message
-    print(f"Total generation time: {helpers.duration(time() - start_time)}")
+    # A full build leaves nothing behind from previous site generations. It's done last
+    # so that files that didn't change aren't removed and written again
+    if not incremental:
+        outputs = {config.get("directories")["output_dir"] / k for k in manifest.outputs}
+        outputs |= {p for path in outputs for p in compressed_siblings(path)}
+        remove_stray_files(outputs | image_outputs | asset_outputs)
+    app["build"]["render_cache"].evict()
 
 
 if __name__ == "__main__":
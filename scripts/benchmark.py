@@ -0,0 +1,292 @@
+import argparse
+import json
+import random
+import resource
+import string
+import struct
+import subprocess
+import sys
+import tempfile
+import zlib
+from collections.abc import Callable
+from pathlib import Path
+from time import perf_counter
+
+
+def make_png(width: int, height: int, /) -> bytes:
+    """Encode a blank image as a PNG, without needing an image library."""
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return (
+            struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+        )
+
+    # Every row of pixels starts with the filter it uses, which is none
+    pixels = b"".join(b"\x00" + b"\x00\x00\x00\x00" * width for _ in range(height))
+    return b"".join((
+        b"\x89PNG\r\n\x1a\n",
+        chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)),
+        chunk(b"IDAT", zlib.compress(pixels, 9)),
+        chunk(b"IEND", b""),
+    ))
+
+
+# A tiny transparent PNG, used for every synthetic image
+PNG_BYTES = make_png(1, 1)
+
+THEME = {
+    "base.jinja2": (
+        "<!doctype html><html><head><title>{% block title %}{{ site.title }}{% endblock %}"
+        '</title><link rel="icon" href="/static/favicon.png"></head><body><header>'
+        '<img src="/static/{{ site.logo.file }}"></header>{% block content %}{% endblock %}'
+        "<footer>&copy; {{ current_year }}</footer></body></html>"
+    ),
+    "post.jinja2": (
+        '{% extends "base.jinja2" %}{% block title %}{{ post.meta.title }}{% endblock %}'
+        "{% block content %}<article><h1>{{ post.meta.title }}</h1><p>"
+        "{{ format_datetime(post.meta.date, site.date_format) }} "
+        '{{ post.meta.tags|join(" ") }}</p>{{ post.content|safe }}</article>{% endblock %}'
+    ),
+    "post_index.jinja2": (
+        '{% extends "base.jinja2" %}{% block content %}<ul>{% for post in posts %}'
+        '<li><a href="{{ post.meta.url }}">{{ post.meta.title }}</a></li>'
+        "{% endfor %}</ul>{% endblock %}"
+    ),
+    "404.jinja2": '{% extends "base.jinja2" %}{% block content %}<p>Not found</p>{% endblock %}',
+}
+
+# The extra build arguments for each scenario
+SCENARIOS = {
+    "full": ["--clear-cache"],
+    "incremental_unchanged": ["--incremental"],
+    "incremental_one_change": ["--incremental"],
+}
+
+
+def get_arguments() -> argparse.Namespace:
+    """Add command-line arguments to the script."""
+    parser = argparse.ArgumentParser(
+        description="Benchmark building a synthetic vault with the real site generator."
+    )
+    parser.add_argument("--posts", type=int, default=500, help="Number of posts (default: 500)")
+    parser.add_argument(
+        "--words", type=int, default=400, help="Number of words in each post (default: 400)"
+    )
+    parser.add_argument(
+        "--images", type=int, default=2, help="Number of images in each post (default: 2)"
+    )
+    parser.add_argument(
+        "--links",
+        type=int,
+        default=3,
+        help="Number of internal links to other posts in each post (default: 3)",
+    )
+    parser.add_argument(
+        "--tags", type=int, default=20, help="Number of distinct tags to use (default: 20)"
+    )
+    parser.add_argument(
+        "--seed", type=int, default=717, help="Seed for generating the vault (default: 717)"
+    )
+    parser.add_argument(
+        "--runs", type=int, default=3, help="How many times to run each scenario (default: 3)"
+    )
+    parser.add_argument(
+        "--vault",
+        type=Path,
+        help="Where to generate the vault (default: a temporary directory)",
+    )
+    parser.add_argument("--baseline", type=Path, help="Compare the results against this file")
+    parser.add_argument("--save", type=Path, help="Save the results to this file")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.1,
+        help="How much slower or larger than the baseline is a regression (default: 0.1)",
+    )
+    parser.add_argument(
+        "build_args",
+        nargs="*",
+        help="Extra arguments to build the site with, given after `--` (e.g., -- --minify -j 4)",
+    )
+    return parser.parse_args()
+
+
+def make_vault(root: Path, args: argparse.Namespace) -> Path:
+    """Generate a synthetic vault, returning the path to its config file."""
+    rng = random.Random(args.seed)
+    directories = {
+        "theme": root / "theme",
+        "root": root / "theme" / "root",
+        "static": root / "theme" / "static",
+        "media": root / "attachments",
+        "posts": root / "published",
+        "output_dir": root / "dist",
+        "cache": root / ".cache",
+    }
+    for directory in directories.values():
+        directory.mkdir(parents=True, exist_ok=True)
+
+    # Create a minimal theme
+    for name, source in THEME.items():
+        (directories["theme"] / name).write_text(source, encoding="utf-8")
+    (directories["root"] / "robots.txt").write_text("User-agent: *\n", encoding="utf-8")
+    (directories["static"] / "logo.svg").write_text("<svg></svg>", encoding="utf-8")
+    (directories["static"] / "favicon.png").write_bytes(PNG_BYTES)
+
+    # Create the posts, each with some paragraphs, images, and links to other posts
+    tags = [f"tag{i}" for i in range(args.tags)]
+    for i in range(args.posts):
+        words = [
+            "".join(rng.choices(string.ascii_lowercase, k=rng.randint(1, 10)))
+            for _ in range(args.words)
+        ]
+        paragraphs = [" ".join(words[j : j + 60]) for j in range(0, len(words), 60)]
+
+        for j in range(args.images):
+            image = f"image-{i}-{j}.png"
+            (directories["media"] / image).write_bytes(PNG_BYTES)
+            paragraphs.append(f"![Image {j} of post {i}](/attachments/{image})")
+
+        links = [
+            f"[post {n}](post-{n}.md)"
+            for n in rng.sample(range(args.posts), min(args.links, args.posts))
+        ]
+        paragraphs.append(f"See also {', '.join(links)}.")
+
+        post_tags = ", ".join(f'"{t}"' for t in rng.sample(tags, min(3, len(tags))))
+        (directories["posts"] / f"post-{i}.md").write_text(
+            "---\n"
+            f'title = "Post {i}: {" ".join(words[:5])}"\n'
+            f"date = {2000 + i // 336:04d}-{i // 28 % 12 + 1:02d}-{i % 28 + 1:02d}\n"
+            f"tags = [{post_tags}]\n"
+            "---\n\n" + "\n\n".join(paragraphs) + "\n",
+            encoding="utf-8",
+        )
+
+    # Tie it all together
+    config_file = root / "config.toml"
+    config_file.write_text(
+        '[site]\ntitle = "Benchmark"\nsubtitle = "A synthetic vault"\n'
+        'domain = "https://example.com"\ndate_format = "%B %d, %Y"\n\n'
+        '[site.logo]\nfile = "logo.svg"\nwidth = 80\nheight = 80\nalt_text = ""\n\n'
+        '[site.pages]\n404_template = "404.jinja2"\n\n'
+        "[directories]\n"
+        + "".join(f'{k} = "{v.as_posix()}"\n' for k, v in directories.items())
+        + '\n[post]\nindex_template = "post_index.jinja2"\npost_template = "post.jinja2"\n'
+        'output_dir = "post"\n\n[post.defaults]\nsubtitle = ""\n',
+        encoding="utf-8",
+    )
+    return config_file
+
+
+def run_build(config_file: Path, build_args: list[str]) -> dict:
+    """Build the site in a fresh process, measuring how long it took."""
+    profile_file = config_file.parent / "profile.json"
+    start_time = perf_counter()
+    subprocess.run(
+        [
+            sys.executable,
+            "generate2.py",
+            "-c",
+            str(config_file),
+            "--profile",
+            str(profile_file),
+            *build_args,
+        ],
+        cwd=Path(__file__).parent.parent,
+        check=True,
+        capture_output=True,
+    )
+    wall_time = perf_counter() - start_time
+    return {"wall_time": wall_time, "stages": json.loads(profile_file.read_text())["stages"]}
+
+
+def run_scenario(
+    name: str,
+    config_file: Path,
+    args: argparse.Namespace,
+    prepare: Callable[[], None] | None = None,
+) -> dict:
+    """Run a build scenario several times, keeping the fastest run."""
+    runs = []
+    for _ in range(args.runs):
+        if prepare is not None:
+            prepare()
+        runs.append(run_build(config_file, SCENARIOS[name] + args.build_args))
+    fastest = min(runs, key=lambda r: r["wall_time"])
+
+    # Express each stage as how many posts it could get through in a second
+    return {
+        "wall_time": fastest["wall_time"],
+        "posts_per_second": args.posts / fastest["wall_time"],
+        "stage_throughput": {
+            k: args.posts / v if v else None for k, v in fastest["stages"].items()
+        },
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """List everything that got worse than the baseline by more than the tolerance."""
+    regressions = []
+    for name, result in results["scenarios"].items():
+        if (before := baseline["scenarios"].get(name)) is None:
+            continue
+        if result["wall_time"] > before["wall_time"] * (1 + tolerance):
+            regressions.append(
+                f"{name}: {result['wall_time']:.3f}s vs {before['wall_time']:.3f}s baseline"
+            )
+    if results["peak_rss_kb"] > baseline["peak_rss_kb"] * (1 + tolerance):
+        regressions.append(
+            f"peak RSS: {results['peak_rss_kb']:,}KB vs {baseline['peak_rss_kb']:,}KB baseline"
+        )
+    return regressions
+
+
+def main() -> None:
+    args = get_arguments()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        root = args.vault or Path(temp_dir)
+        print(f"Generating a vault of {args.posts:,} posts in {root}")
+        config_file = make_vault(root, args)
+
+        # Changing a single post is the most common kind of rebuild
+        changed_post = root / "published" / "post-0.md"
+
+        def change_post() -> None:
+            with changed_post.open("a", encoding="utf-8") as f:
+                f.write("\nOne more line.\n")
+
+        results = {
+            "vault": {k: getattr(args, k) for k in ("posts", "words", "images", "links", "tags")},
+            "build_args": args.build_args,
+            "scenarios": {
+                "full": run_scenario("full", config_file, args),
+                "incremental_unchanged": run_scenario("incremental_unchanged", config_file, args),
+                "incremental_one_change": run_scenario(
+                    "incremental_one_change", config_file, args, prepare=change_post
+                ),
+            },
+            # The largest resident set size of any of the builds
+            "peak_rss_kb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+        }
+
+    for name, result in results["scenarios"].items():
+        print(f"\t* {name}: {result['wall_time']:.3f}s ({result['posts_per_second']:,.0f} posts/s)")
+    print(f"\t* peak RSS: {results['peak_rss_kb']:,}KB")
+
+    if args.save:
+        args.save.write_text(json.dumps(results, indent=2), encoding="utf-8")
+
+    # Fail when anything regressed so this can gate a release
+    if args.baseline:
+        regressions = compare(
+            results, json.loads(args.baseline.read_text(encoding="utf-8")), args.tolerance
+        )
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
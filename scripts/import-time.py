@@ -0,0 +1,68 @@
+import argparse
+import subprocess
+import sys
+from pathlib import Path
+
+
+# Modules that must only be imported once they're actually needed
+LAZY_MODULES = ("jinja2", "markdown_it", "mdit_py_plugins", "minify_html")
+
+
+def get_arguments() -> argparse.Namespace:
+    """Add command-line arguments to the script."""
+    parser = argparse.ArgumentParser(
+        description="Check that starting the site generator stays within an import time budget."
+    )
+    parser.add_argument(
+        "--budget",
+        type=float,
+        default=100,
+        help="The most time, in ms, importing the generator may take (default: 100)",
+    )
+    parser.add_argument(
+        "--runs", type=int, default=5, help="How many times to measure it (default: 5)"
+    )
+    return parser.parse_args()
+
+
+def measure() -> dict[str, int]:
+    """Import the generator in a fresh process, getting the cumulative import time of each module."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import generate2"],
+        cwd=Path(__file__).parent.parent,
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+
+    # Each line looks like `import time: self [us] | cumulative | imported package`
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.removeprefix("import time:").split("|")
+        modules[name.strip()] = int(cumulative)
+    return modules
+
+
+def main() -> None:
+    args = get_arguments()
+    runs = [measure() for _ in range(args.runs)]
+
+    # The fastest run is the one least disturbed by anything else going on
+    elapsed = min(r["generate2"] for r in runs) / 1000
+    print(f"Importing the generator took {elapsed:,.1f}ms (budget: {args.budget:,.1f}ms)")
+
+    failures = [f"{elapsed:,.1f}ms is over the budget"] if elapsed > args.budget else []
+    failures.extend(
+        f"{name} was imported on startup"
+        for name in sorted({m.split(".")[0] for m in runs[0]} & set(LAZY_MODULES))
+    )
+    for failure in failures:
+        print(f"Failed: {failure}")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+import argparse
+import random
+import string
+import sys
+import tracemalloc
+from collections.abc import Callable
+from pathlib import Path
+from time import perf_counter
+
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.app import config
+from src.core.helpers import NORMALISATIONS, normalise_text
+
+
+# The kinds of post bodies to measure reading
+KINDS = ("ascii", "typographic", "typographic_with_code")
+
+
+def get_arguments() -> argparse.Namespace:
+    """Add command-line arguments to the script."""
+    parser = argparse.ArgumentParser(
+        description="Benchmark how long normalising the text of a post takes, "
+        "and how much memory it takes at most, before and after batching the normalisations."
+    )
+    parser.add_argument("--posts", type=int, default=500, help="Number of posts (default: 500)")
+    parser.add_argument(
+        "--words", type=int, default=2000, help="Number of words in each post (default: 2000)"
+    )
+    parser.add_argument(
+        "--normalise",
+        nargs="*",
+        choices=sorted(NORMALISATIONS),
+        default=["quotes"],
+        help="The typographic normalisations to make (default: quotes)",
+    )
+    parser.add_argument(
+        "--seed", type=int, default=717, help="Seed for generating the posts (default: 717)"
+    )
+    return parser.parse_args()
+
+
+def make_post(kind: str, words: int, rng: random.Random) -> str:
+    """Write the body of a synthetic post."""
+    vocabulary = [
+        "".join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 9))) for _ in range(200)
+    ]
+    if kind != "ascii":
+        vocabulary += ["“quoted”", "it’s", "‘single’", "wait…", "a—b"]
+
+    lines = []
+    for i in range(0, words, 20):
+        lines.append(" ".join(rng.choices(vocabulary, k=20)))
+        if kind == "typographic_with_code" and i % 200 == 0:
+            lines.append("```python\nx = “kept”\n```")
+    return "\n\n".join(lines) + "\n"
+
+
+def read_before(text: str, /) -> str:
+    """Normalise a post body the way it was before."""
+    return text.replace("“", '"').replace("”", '"').replace("‘", "'").replace("’", "'").strip()
+
+
+def read_after(text: str, /) -> str:
+    """Normalise a post body the way it's done now."""
+    return normalise_text(text.strip(), skip_code=True)
+
+
+def peak_memory(read: Callable[[str], str], text: str, /) -> int:
+    """Measure the most memory reading a post body had allocated at once, in characters.
+
+    Every copy of the text is allocated while the previous one is still around, so this is
+    the size of the text plus the largest copies made along the way.
+    """
+    tracemalloc.start()
+    try:
+        read(text)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def measure(read: Callable[[str], str], posts: list[str]) -> dict[str, float]:
+    """Read every post, getting the average time and peak memory for each.
+
+    The memory is measured separately, as tracing it slows everything else down.
+    """
+    start_time = perf_counter()
+    for post in posts:
+        read(post)
+    elapsed = perf_counter() - start_time
+    return {
+        "us_per_post": elapsed / len(posts) * 1e6,
+        "peak_kib_per_post": sum(peak_memory(read, post) for post in posts) / len(posts) / 1024,
+    }
+
+
+def main() -> None:
+    args = get_arguments()
+    config.set("typography", {"normalise": args.normalise})
+    rng = random.Random(args.seed)
+
+    print(f"Normalising {args.posts:,} posts of {args.words:,} words ({', '.join(args.normalise)})")
+    for kind in KINDS:
+        posts = [make_post(kind, args.words, rng) for _ in range(args.posts)]
+        size = sum(len(p) for p in posts) / len(posts)
+        print(f"\t* {kind} ({size:,.0f} characters per post):")
+        for name, read in (("before", read_before), ("after", read_after)):
+            result = measure(read, posts)
+            print(
+                f"\t\t- {name}: {result['us_per_post']:,.1f}us, "
+                f"{result['peak_kib_per_post']:,.1f}KiB peak memory per post"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,30 +1,45 @@
 import argparse
+import importlib.util
+from collections.abc import Callable
 from contextlib import suppress
 from contextvars import ContextVar
 from pathlib import Path
-from typing import Any
-
-from jinja2 import Environment, FileSystemLoader, select_autoescape
-from markdown_it import MarkdownIt
-from mdit_py_plugins.front_matter import front_matter_plugin
-from mdit_py_plugins.wordcount import wordcount_plugin
+from typing import TYPE_CHECKING, Any
 
 from ..core import helpers
 from . import config, render_rules
 
 
+if TYPE_CHECKING:
+    from jinja2 import Environment
+    from markdown_it import MarkdownIt
+
+
+# The Markdown syntax posts are written in
+MARKDOWN_PRESET = "gfm-like"
+
 APP: ContextVar[dict[str, dict[str, Any]]] = ContextVar("app", default={})
 
 
-def get_arguments() -> argparse.Namespace:
-    """Add command-line arguments to the script."""
+def create_parser() -> argparse.ArgumentParser:
+    """Describe the command-line arguments of the script."""
     parser = argparse.ArgumentParser()
     parser.add_argument(
         "-c",
         "--config",
         action="store",
-        default="config.toml",
-        help="Specify the config TOML file to use when building the site.",
+        nargs="+",
+        type=Path,
+        default=[Path("config.toml")],
+        help="Specify the config TOML file to use when building the site. "
+        "Give several to build several sites (default: config.toml)",
+    )
+    parser.add_argument(
+        "--site-threads",
+        action="store",
+        type=int,
+        default=1,
+        help="Number of sites to build at the same time when given several configs (default: 1)",
     )
     parser.add_argument(
         "-m",
@@ -32,11 +47,153 @@ def get_arguments() -> argparse.Namespace:
         action="store_true",
         help="Should the generated files be minified? (default: no)",
     )
+    parser.add_argument(
+        "--minify-threshold",
+        action="store",
+        type=int,
+        default=0,
+        help="Leave pages smaller than this many bytes unminified (default: 0)",
+    )
+    parser.add_argument(
+        "--precompress",
+        action="store",
+        nargs="*",
+        choices=["gz", "br"],
+        default=[],
+        help="Also save compressed versions of text files, for servers to send as they are. "
+        "Brotli (br) needs the `brotli` package (default: none)",
+    )
+    parser.add_argument(
+        "-i",
+        "--incremental",
+        action="store_true",
+        help="Only rebuild the posts that changed since the last build (default: no)",
+    )
+    parser.add_argument(
+        "--plan",
+        action="store_true",
+        help="Point out what building the site would change and why, "
+        "along with how long it would take, without building it (default: no)",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        action="store",
+        type=int,
+        default=1,
+        help="Number of processes to render posts with (default: 1)",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Don't reuse or save rendered Markdown and minified HTML (default: no)",
+    )
+    parser.add_argument(
+        "--clear-cache",
+        action="store_true",
+        help="Remove all rendered Markdown and minified HTML before building (default: no)",
+    )
+    parser.add_argument(
+        "--cache-size",
+        action="store",
+        type=int,
+        default=512,
+        help="The most space, in MB, to keep rendered Markdown and minified HTML in (default: 512)",
+    )
+    parser.add_argument(
+        "--precompile-templates",
+        action="store_true",
+        help="Compile every template in the theme up front, so later builds can load them "
+        "already compiled (default: no)",
+    )
+    parser.add_argument(
+        "--asset-link",
+        action="store",
+        choices=["copy", "hardlink", "reflink"],
+        default="copy",
+        help="How to put asset files in the output directory, falling back to copying (default: copy)",
+    )
+    parser.add_argument(
+        "--asset-checksum",
+        action="store_true",
+        help="Compare the contents of asset files that look changed before copying (default: no)",
+    )
+    parser.add_argument(
+        "--fingerprint-assets",
+        action="store_true",
+        help="Also copy every static file to a name with its content hash in it, for "
+        "`asset_url()` to link to, so they can be cached forever (default: no)",
+    )
+    parser.add_argument(
+        "--write-threads",
+        action="store",
+        type=int,
+        default=0,
+        help="Number of threads to write files in the background with (default: 0, write inline)",
+    )
+    parser.add_argument(
+        "--low-memory",
+        action="store_true",
+        help="Only keep the content of posts in memory while they're rendered. "
+        "Index templates will not have access to post content (default: no)",
+    )
+    parser.add_argument(
+        "-w",
+        "--watch",
+        action="store_true",
+        help="Serve the site locally, rebuilding it as files change (default: no)",
+    )
+    parser.add_argument(
+        "-p",
+        "--port",
+        action="store",
+        type=int,
+        default=8000,
+        help="The port to serve the site on when watching (default: 8000)",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store",
+        nargs="?",
+        type=Path,
+        const=Path("profile.json"),
+        help="Report how long each stage took and save it as JSON (default: profile.json)",
+    )
+    parser.add_argument(
+        "--profile-slowest",
+        action="store",
+        type=int,
+        default=10,
+        help="How many of the slowest posts to report when profiling (default: 10)",
+    )
+    parser.add_argument(
+        "--cprofile",
+        action="store",
+        type=Path,
+        help="Save cProfile stats of the build to this file (default: none)",
+    )
+    parser.add_argument(
+        "--responsive-images",
+        action="store_true",
+        help="Resize the images in posts to several widths and formats, for browsers to "
+        "pick from. Needs the `Pillow` package (default: no)",
+    )
+    parser.add_argument(
+        "--search",
+        action="store_true",
+        help="Generate a search index of every post for the browser to use (default: no)",
+    )
     parser.add_argument(
         "--no-feed",
         action="store_true",
         help="Disable generating RSS and JSON feed files (default: no)",
     )
+    return parser
+
+
+def get_arguments() -> argparse.Namespace:
+    """Get the command-line arguments the script was invoked with."""
+    parser = create_parser()
     args = parser.parse_args()
 
     # Display the argument values used
@@ -47,33 +204,119 @@ def get_arguments() -> argparse.Namespace:
     return args
 
 
-def create_app() -> dict[str, dict[str, Any]]:
-    # Get the arguments the script was invoked with and set up the app config
-    args = get_arguments()
+def get_options(config_file: str | Path, /, **options: Any) -> argparse.Namespace:
+    """Get the options to build a site with, the same way they're given on the command line.
+
+    Each option is named after its command-line argument, like `minify` or `jobs`,
+    and every option that isn't given has its command-line default.
+    """
+    args = create_parser().parse_args([])
+    if unknown := options.keys() - vars(args).keys():
+        raise RuntimeError(f"Unknown build options: {', '.join(sorted(unknown))}")
+    for k, v in options.items():
+        setattr(args, k, v)
+    args.config = Path(config_file)
+    return args
+
+
+def create_app(args: argparse.Namespace, /) -> dict[str, dict[str, Any]]:
+    """Set up the app config and renderers to build the site of a single config file."""
     config.set_initial(Path(args.config))
     config.set("minify", args.minify)
+    config.set("minify_threshold", args.minify_threshold)
+    config.set("precompress", args.precompress)
+    if "br" in args.precompress and importlib.util.find_spec("brotli") is None:
+        raise RuntimeError("Precompressing with Brotli requires the `brotli` package")
     config.set("feed", not args.no_feed)
+    config.set("search_index", args.search)
+    config.set("responsive_images", args.responsive_images)
+    if args.responsive_images and importlib.util.find_spec("PIL") is None:
+        raise RuntimeError("Resizing images requires the `Pillow` package")
+    config.set("incremental", args.incremental)
+    config.set("plan", args.plan)
+    config.set("jobs", max(1, args.jobs))
+    config.set("low_memory", args.low_memory)
+    config.set("write_threads", args.write_threads)
+    config.set("cache", not args.no_cache)
+    config.set("clear_cache", args.clear_cache)
+    config.set("cache_size", args.cache_size)
+    config.set("precompile_templates", args.precompile_templates)
+    config.set("asset_link", args.asset_link)
+    config.set("asset_checksum", args.asset_checksum)
+    config.set("fingerprint_assets", args.fingerprint_assets)
+    config.set("watch", args.watch)
+    config.set("profile", args.profile)
+    config.set("profile_slowest", args.profile_slowest)
+    config.set("cprofile", args.cprofile)
+    config.set("port", args.port)
+    return create_renderers()
+
 
-    # Create our markdown -> html renderer
-    markdown = MarkdownIt("gfm-like").use(front_matter_plugin).use(wordcount_plugin)
+def create_renderers() -> dict[str, dict[str, Any]]:
+    """Set up the renderers for the current config.
+
+    Each renderer is only imported and created the first time it's needed,
+    so that builds which don't need one don't pay for it.
+    """
+    # Every site gets an app of its own, so sites can be built side by side
+    app: dict[str, dict[str, Any]] = {"render": {}}
+    APP.set(app)
+    return app
+
+
+def create_markdown() -> "MarkdownIt":
+    """Create the Markdown -> HTML renderer."""
+    from markdown_it import MarkdownIt
+
+    # Post meta and reading stats are read separately, so there's nothing for plugins to handle
+    markdown = MarkdownIt(MARKDOWN_PRESET)
     markdown.options["xhtmlOut"] = False
     markdown.add_render_rule("link_open", render_rules.render_link_open)
     markdown.add_render_rule("image", render_rules.render_image_caption)
+    return markdown
 
-    # Create our jinja2 html renderer
+
+def create_jinja() -> "Environment":
+    """Create the HTML renderer."""
+    from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, select_autoescape
+
+    # Compiled templates are kept between builds,
+    # and are recompiled whenever the source of a template changes.
+    # A plan doesn't compile any templates, and leaves the cache as it is
+    bytecode_cache = None
+    if config.get("cache") and not config.get("plan"):
+        bytecode_dir: Path = config.get("directories")["cache"] / "jinja"
+        bytecode_dir.mkdir(parents=True, exist_ok=True)
+        bytecode_cache = FileSystemBytecodeCache(bytecode_dir)
     jinja = Environment(
         loader=FileSystemLoader(config.get("directories")["theme"]),
         autoescape=select_autoescape(["html"]),
+        bytecode_cache=bytecode_cache,
     )
     jinja.globals.update(helpers.ALL_GLOBALS)
     jinja.globals.update({"site": config.get("site")})
     jinja.filters.update(helpers.ALL_FILTERS)
+    return jinja
 
-    # Put everything together
-    app = current_app()
-    app["render"] = {"markdown": markdown, "jinja": jinja}
-    APP.set(app)
-    return app
+
+RENDERERS: dict[str, Callable[[], Any]] = {"markdown": create_markdown, "jinja": create_jinja}
+
+# Renderers that don't depend on the config are shared by every site built in this process
+SHARED_RENDERERS: dict[str, Any] = dict.fromkeys(["markdown"])
+
+
+def get_renderer(name: str, /) -> Any:
+    """Get one of the renderers, creating it the first time it's needed."""
+    render = current_app()["render"]
+    if name not in render:
+        if name not in SHARED_RENDERERS:
+            render[name] = RENDERERS[name]()
+        else:
+            # Sites being built at the same time may each create it first, which does no harm
+            if SHARED_RENDERERS[name] is None:
+                SHARED_RENDERERS[name] = RENDERERS[name]()
+            render[name] = SHARED_RENDERERS[name]
+    return render[name]
 
 
 def current_app() -> dict[str, dict[str, Any]]:
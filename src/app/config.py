@@ -7,7 +7,7 @@ from typing import Any
 APP_CONFIG: ContextVar[dict[str, dict[str, Any]]] = ContextVar("config", default={})
 
 
-__all__ = ["get", "set", "set_initial"]
+__all__ = ["get", "load", "set", "set_initial"]
 
 
 def get(key: str) -> Any:
@@ -21,10 +21,22 @@ def set(key: str, value: Any) -> None:
     APP_CONFIG.set(config)
 
 
-def set_initial(config_file: Path) -> None:
+def load(config_file: Path) -> dict[str, Any]:
+    """Read a config file, filling in the optional parts."""
     data = tomllib.loads(config_file.read_text())
 
+    # Build state is kept next to the config unless told otherwise
+    data["directories"].setdefault("cache", str(config_file.parent / ".cache"))
+    data.setdefault("discovery", {})
+    data.setdefault("typography", {})
+    data.setdefault("feeds", {})
+    data.setdefault("search", {})
+    data.setdefault("images", {})
+
     # Convert all directory paths to actual Path objects before saving for direct usage
     data["directories"] = {k: Path(v) for k, v in data["directories"].items()}
+    return data
 
-    APP_CONFIG.set(data)
+
+def set_initial(config_file: Path) -> None:
+    APP_CONFIG.set(load(config_file))
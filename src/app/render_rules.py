@@ -1,24 +1,74 @@
-__all__ = ["render_image_caption", "render_link_open"]
+import posixpath
+from urllib.parse import unquote, urlsplit
+
+
+__all__ = ["VERSION", "image_url", "render_image", "render_image_caption", "render_link_open"]
+
+
+# Bump this whenever a rule changes what it renders, so cached renders are not reused
+VERSION = 5
 
 
 def render_image_caption(self, tokens, idx: int, options, env):
     # If there's no alt text, render as normal
     if tokens[0].children is None:
-        return self.image(tokens, idx, options, env)
+        return render_image(self, tokens, idx, options, env)
 
     # Overload the alt text to generate a figure and with caption
     caption = self.renderInline(tokens[0].children, options, env)
-    img_tag = self.image(tokens, idx, options, env)
+    img_tag = render_image(self, tokens, idx, options, env)
     return f"<figure>{img_tag}<figcaption>{caption}</figcaption></figure>"
 
 
+def image_url(src: str, /) -> str:
+    """Get the URL an image is known by in the image index, however its source is written.
+
+    Sources are percent-encoded by the Markdown renderer, and may be relative to the site root.
+    """
+    parts = urlsplit(src)
+    if parts.scheme or parts.netloc:
+        return src
+    return posixpath.normpath(f"/{unquote(parts.path).lstrip('/')}")
+
+
+def render_image(self, tokens, idx: int, options, env):
+    """Render an image, letting the browser pick from its resized versions if there are any."""
+    if "image_index" not in env:
+        return self.image(tokens, idx, options, env)
+
+    # Remember every image the post shows so incremental builds
+    # know to rerender it when the image is resized differently
+    src = image_url(tokens[idx].attrs["src"])
+    info = env["image_index"].get(src)
+    env["images"][src] = info["key"] if info else None
+    if info is None:
+        return self.image(tokens, idx, options, env)
+
+    # Give the size up front so the page doesn't shift around as it loads
+    tokens[idx].attrSet("width", str(info["width"]))
+    tokens[idx].attrSet("height", str(info["height"]))
+    tokens[idx].attrSet("loading", "lazy")
+    tokens[idx].attrSet("decoding", "async")
+    sources = "".join(
+        f'<source type="{s["type"]}" srcset="{s["srcset"]}" sizes="{info["sizes"]}">'
+        for s in info["sources"]
+    )
+    return f"<picture>{sources}{self.image(tokens, idx, options, env)}</picture>"
+
+
 def render_link_open(self, tokens, idx: int, options, env):
     """Add render rule for `link_open`."""
     # Add "don't track" signals to an `<a>` tag
     tokens[idx].attrSet("rel", "noopener noreferrer")
 
     # When possible, if the link target is an internal link, indicated by a markdown file name,
-    # replace it with the generated slug
-    if "all_urls" in env and tokens[idx].attrs["href"] in env["all_urls"]:
-        tokens[idx].attrs["href"] = env["all_urls"][tokens[idx].attrs["href"]]
+    # replace it with the generated slug. Every relative link the post makes is remembered,
+    # even to posts that don't exist yet, so incremental builds know to rerender it when
+    # the linked post moves or appears
+    href = tokens[idx].attrs["href"]
+    if "link_index" in env and env["link_index"].target(href) is not None:
+        url = env["link_index"].url(href)
+        env["internal_links"][href] = url
+        if url is not None:
+            tokens[idx].attrs["href"] = url
     return self.renderToken(tokens, idx, options, env)
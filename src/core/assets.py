@@ -0,0 +1,217 @@
+import hashlib
+import json
+import os
+import shutil
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any
+
+from src.app import config
+
+
+__all__ = ["SyncReport", "asset_destinations", "copy_file", "remove_stray_files", "sync_assets"]
+
+
+# The Linux `FICLONE` ioctl, for copy-on-write file clones
+FICLONE = 0x40049409
+
+
+@dataclass(slots=True)
+class SyncReport:
+    """Keep count of what an asset sync did."""
+
+    copied: int = 0
+    copied_bytes: int = 0
+    skipped: int = 0
+    skipped_bytes: int = 0
+    removed: int = 0
+
+    def __str__(self) -> str:
+        return (
+            f"copied {self.copied:,} files ({self.copied_bytes:,} bytes), "
+            f"skipped {self.skipped:,} files ({self.skipped_bytes:,} bytes), "
+            f"removed {self.removed:,} files"
+        )
+
+
+def asset_destinations() -> dict[str, Path]:
+    """Get where each of the asset directories is copied to in the output directory."""
+    all_directories: dict[str, Path] = config.get("directories")
+    dist_path: Path = all_directories["output_dir"]
+    return {
+        "media": dist_path / all_directories["media"].stem,
+        "static": dist_path / "static",
+        "root": dist_path,
+    }
+
+
+def list_files(directory: Path, /) -> dict[Path, os.stat_result]:
+    """List every file in a directory tree, relative to it."""
+    # Paths are put together as strings while walking, which is much faster than with `Path`
+    files: dict[Path, os.stat_result] = {}
+    pending = [""] if directory.is_dir() else []
+    while pending:
+        rel_dir = pending.pop()
+        with os.scandir(directory / rel_dir) as it:
+            for entry in it:
+                if entry.is_dir():
+                    pending.append(f"{rel_dir}{entry.name}/")
+                else:
+                    files[Path(f"{rel_dir}{entry.name}")] = entry.stat()
+    return files
+
+
+def file_hash(path: Path, /) -> str:
+    """Hash a file without reading it all into memory at once."""
+    with path.open("rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+def hash_file(path: Path, stat: os.stat_result, /, previous: dict[str, Any]) -> dict[str, Any]:
+    """Record the content hash of a file, along with what the file looked like when hashed.
+
+    A file that looks the same as in its `previous` record isn't hashed again,
+    and the rest of that record is kept as long as the content is the same.
+    """
+    if looks_unchanged(previous, stat):
+        return previous
+    entry = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "digest": file_hash(path)}
+    return previous | entry if previous.get("digest") == entry["digest"] else entry
+
+
+def looks_unchanged(entry: dict[str, Any], stat: os.stat_result, /) -> bool:
+    """Determine if a file looks the same as when it was recorded, without reading it."""
+    return entry.get("size") == stat.st_size and entry.get("mtime_ns") == stat.st_mtime_ns
+
+
+def load_record(name: str, /) -> dict[str, Any]:
+    """Load what the last build recorded in the cache under a name."""
+    record_path: Path = config.get("directories")["cache"] / f"{name}.json"
+    return json.loads(record_path.read_text(encoding="utf-8")) if record_path.exists() else {}
+
+
+def save_record(name: str, record: dict[str, Any], /) -> None:
+    """Record something in the cache under a name, for the next build to load."""
+    record_path: Path = config.get("directories")["cache"] / f"{name}.json"
+    record_path.parent.mkdir(parents=True, exist_ok=True)
+    record_path.write_text(json.dumps(record), encoding="utf-8")
+
+
+def is_current(source: Path, source_stat: os.stat_result, destination: Path) -> bool:
+    """Determine if a copied asset is still the same as its source."""
+    try:
+        dest_stat = destination.stat()
+    except FileNotFoundError:
+        return False
+
+    # A hard link is always current, and a copy is current when it looks
+    # exactly like the source. Optionally, look closer at anything that doesn't
+    if dest_stat.st_ino == source_stat.st_ino and dest_stat.st_dev == source_stat.st_dev:
+        return True
+    if dest_stat.st_size != source_stat.st_size:
+        return False
+    if dest_stat.st_mtime_ns == source_stat.st_mtime_ns:
+        return True
+    if config.get("asset_checksum") and file_hash(source) == file_hash(destination):
+        shutil.copystat(source, destination)
+        return True
+    return False
+
+
+def copy_file(source: Path, destination: Path) -> None:
+    """Copy a single asset, linking it instead if requested and possible."""
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    destination.unlink(missing_ok=True)
+    method: str = config.get("asset_link")
+
+    # Linking only works when the source and output are on the same filesystem
+    # (and, for reflinks, one that supports them), so fall back to a normal copy
+    if method == "hardlink":
+        try:
+            destination.hardlink_to(source)
+            return
+        except OSError:
+            pass
+
+    elif method == "reflink":
+        try:
+            import fcntl
+
+            with source.open("rb") as src, destination.open("wb") as dest:
+                fcntl.ioctl(dest.fileno(), FICLONE, src.fileno())
+            shutil.copystat(source, destination)
+            return
+        except (ImportError, OSError):
+            destination.unlink(missing_ok=True)
+
+    shutil.copy2(source, destination)
+
+
+def synced_files() -> set[Path]:
+    """Get every asset file the last sync put in the output directory."""
+    record_path: Path = config.get("directories")["cache"] / "assets.json"
+    if not record_path.exists():
+        return set()
+    return {Path(p) for p in json.loads(record_path.read_text(encoding="utf-8"))["files"]}
+
+
+def remove_stray_files(outputs: set[Path], /) -> int:
+    """Remove every file in the output directory that is neither an asset nor in `outputs`."""
+    dist_path: Path = config.get("directories")["output_dir"]
+    keep = outputs | synced_files()
+    removed = 0
+    for name in list_files(dist_path):
+        if (path := dist_path / name) not in keep:
+            path.unlink()
+            removed += 1
+
+    # Clear out any directories that were emptied
+    for directory, _, _ in os.walk(dist_path, topdown=False):
+        if Path(directory) != dist_path and not any(Path(directory).iterdir()):
+            Path(directory).rmdir()
+    return removed
+
+
+def wanted_assets() -> dict[Path, tuple[Path, os.stat_result]]:
+    """Work out where every asset file should end up, along with its source."""
+    all_directories: dict[str, Path] = config.get("directories")
+    wanted: dict[Path, tuple[Path, os.stat_result]] = {}
+    for key, destination in asset_destinations().items():
+        for name, stat in list_files(all_directories[key]).items():
+            wanted[destination / name] = (all_directories[key] / name, stat)
+    return wanted
+
+
+def sync_assets() -> SyncReport:
+    """Bring the assets in the output directory up to date with their sources.
+
+    Only the files that changed are copied, and the assets whose source
+    was removed since the last sync are removed.
+    """
+    all_directories: dict[str, Path] = config.get("directories")
+    record_path: Path = all_directories["cache"] / "assets.json"
+    report = SyncReport()
+
+    # Remove anything that shouldn't be there anymore
+    wanted = wanted_assets()
+    for path in synced_files() - wanted.keys():
+        path.unlink(missing_ok=True)
+        report.removed += 1
+
+    # Copy over everything that changed
+    for destination, (source, stat) in wanted.items():
+        if is_current(source, stat, destination):
+            report.skipped += 1
+            report.skipped_bytes += stat.st_size
+            continue
+        copy_file(source, destination)
+        report.copied += 1
+        report.copied_bytes += stat.st_size
+
+    # Record what was synced, so the next sync knows what it's responsible for
+    record_path.parent.mkdir(parents=True, exist_ok=True)
+    record_path.write_text(
+        json.dumps({"files": sorted(str(p) for p in wanted), "report": asdict(report)}),
+        encoding="utf-8",
+    )
+    return report
@@ -0,0 +1,125 @@
+import json
+import os
+import shutil
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from src.app import MARKDOWN_PRESET, config, get_renderer, render_rules
+
+from .helpers import content_hash
+from .images import image_settings
+
+
+__all__ = ["RenderCache", "create_render_cache", "precompile_templates", "renderer_fingerprint"]
+
+
+if TYPE_CHECKING:
+    from jinja2 import Environment
+
+
+def renderer_fingerprint() -> str:
+    """Fingerprint everything about the renderers that can change what they output.
+
+    This is done without creating the renderers, so a build that finds
+    everything in the cache never has to.
+    """
+    from importlib.metadata import version
+
+    return content_hash(
+        json.dumps(
+            {
+                "markdown": {"preset": MARKDOWN_PRESET, "render_rules": render_rules.VERSION},
+                "minify": config.get("minify"),
+                "images": image_settings() if config.get("responsive_images") else None,
+                "packages": {
+                    p: version(p)
+                    for p in ("markdown-it-py", "mdit-py-plugins", "linkify-it-py", "minify-html")
+                },
+            },
+            default=str,
+            sort_keys=True,
+        )
+    )
+
+
+@dataclass(slots=True)
+class RenderCache:
+    """Keep rendered content on disk, addressed by what it was rendered from.
+
+    Entries are kept until the cache grows past `max_size` bytes,
+    at which point the least recently used entries are removed.
+    """
+
+    directory: Path
+    fingerprint: str
+    max_size: int
+    enabled: bool = True
+
+    def path(self, namespace: str, key: str) -> Path:
+        digest = content_hash(f"{self.fingerprint}{key}")
+        return self.directory / namespace / digest[:2] / digest
+
+    def get(self, namespace: str, key: str) -> bytes | None:
+        """Get a cached entry, if there is one."""
+        if not self.enabled:
+            return None
+
+        path = self.path(namespace, key)
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            return None
+
+        # Mark the entry as recently used so it is the last to be evicted
+        os.utime(path)
+        return data
+
+    def set(self, namespace: str, key: str, data: bytes) -> None:
+        """Add an entry to the cache."""
+        if not self.enabled:
+            return
+
+        # Several processes may be writing to the cache at once,
+        # so make sure no one can read a half-written entry
+        path = self.path(namespace, key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        temp_path.write_bytes(data)
+        temp_path.replace(path)
+
+    def evict(self) -> None:
+        """Remove the least recently used entries until the cache fits in its size limit."""
+        if not self.enabled or not self.directory.exists():
+            return
+
+        entries = [(p, p.stat()) for p in self.directory.glob("*/*/*") if p.is_file()]
+        total_size = sum(stat.st_size for _, stat in entries)
+        for path, stat in sorted(entries, key=lambda x: x[1].st_mtime_ns):
+            if total_size <= self.max_size:
+                break
+            path.unlink(missing_ok=True)
+            total_size -= stat.st_size
+
+    def clear(self) -> None:
+        """Remove every entry in the cache."""
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def precompile_templates() -> int:
+    """Compile every template in the theme into the bytecode cache, returning how many there are."""
+    jinja: Environment = get_renderer("jinja")
+    names = jinja.list_templates(extensions=["jinja2"])
+    for name in names:
+        jinja.get_template(name)
+    return len(names)
+
+
+def create_render_cache() -> RenderCache:
+    """Create the render cache as set up by the config."""
+    return RenderCache(
+        config.get("directories")["cache"] / "render",
+        fingerprint=renderer_fingerprint(),
+        max_size=config.get("cache_size") * 1024 * 1024,
+        enabled=config.get("cache"),
+    )
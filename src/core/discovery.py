@@ -0,0 +1,148 @@
+import json
+import os
+import re
+import tomllib
+from datetime import date
+from functools import cache
+from pathlib import Path
+from typing import Any
+
+from src.app import config
+from src.models import parse_date
+
+from .helpers import normalise_text, read_front_matter
+
+
+__all__ = ["discover_posts", "discovery_settings", "glob_to_regex", "read_status"]
+
+
+# Bump this whenever the front matter of posts is read differently, so every post is read again
+VERSION = 2
+
+
+def discovery_settings() -> dict[str, Any]:
+    """Get the post discovery config, filling in the defaults."""
+    settings = {"include": ["*.md"], "exclude": [], "drafts": False, "future": True}
+    return settings | config.get("discovery")
+
+
+@cache
+def glob_to_regex(pattern: str, /) -> re.Pattern:
+    """Convert a glob of a path relative to the posts directory to a regex.
+
+    `*` matches within a single directory, and `**/` matches any number of directories.
+    """
+    regex = ""
+    for part in re.split(r"(\*\*/|\*|\?)", pattern):
+        if part == "**/":
+            regex += "(?:.*/)?"
+        elif part == "*":
+            regex += "[^/]*"
+        elif part == "?":
+            regex += "[^/]"
+        else:
+            regex += re.escape(part)
+    return re.compile(regex)
+
+
+def matches(path: str, patterns: list[str], /) -> bool:
+    return any(glob_to_regex(p).fullmatch(path) for p in patterns)
+
+
+def read_status(path: Path, /) -> dict[str, Any]:
+    """Find out if a post is meant to be published, and when, reading nothing but its front matter.
+
+    A post is not published when it's marked as a `draft`, or not to `publish`.
+    """
+    with path.open(encoding="utf-8") as f:
+        raw_meta = read_front_matter(f)
+
+    # A post that can't be read is left for rendering to complain about
+    try:
+        meta = tomllib.loads(normalise_text(raw_meta))
+    except tomllib.TOMLDecodeError:
+        return {"published": True, "date": None}
+
+    # The date is read the same way as when rendering, which complains about a bad one
+    published = not meta.get("draft", False) and meta.get("publish", True)
+    try:
+        post_date = parse_date(meta.get("date"), name=path.name).isoformat()
+    except RuntimeError:
+        post_date = None
+    return {"published": bool(published), "date": post_date}
+
+
+def is_listed(status: dict[str, Any], settings: dict[str, Any], /) -> bool:
+    """Determine if a post should be built, given what its front matter says."""
+    if not status["published"] and not settings["drafts"]:
+        return False
+    return (
+        settings["future"] or status["date"] is None or status["date"] <= date.today().isoformat()
+    )
+
+
+def discover_posts(*, save: bool = True) -> list[Path]:
+    """Find every post to publish in the posts directory and below it.
+
+    What was found is kept between builds, unless `save` is off. A directory that hasn't
+    changed doesn't need to be listed again, and a post that hasn't changed doesn't need
+    to be looked at again.
+    """
+    posts_dir: Path = config.get("directories")["posts"]
+    settings = discovery_settings()
+    record_path: Path = config.get("directories")["cache"] / "discovery.json"
+    record = json.loads(record_path.read_text(encoding="utf-8")) if record_path.exists() else {}
+    if record.get("settings") != settings or record.get("version") != VERSION:
+        record = {}
+    previous_dirs: dict[str, dict[str, Any]] = record.get("dirs", {})
+    previous_files: dict[str, dict[str, Any]] = record.get("files", {})
+
+    # Walk every directory, only listing the ones that changed.
+    # Excluded directories aren't walked at all
+    dirs: dict[str, dict[str, Any]] = {}
+    candidates: list[str] = []
+    pending = [""] if posts_dir.is_dir() else []
+    while pending:
+        rel_dir = pending.pop()
+        mtime_ns = (posts_dir / rel_dir).stat().st_mtime_ns
+        if (entry := previous_dirs.get(rel_dir)) is None or entry["mtime_ns"] != mtime_ns:
+            entry = {"mtime_ns": mtime_ns, "dirs": [], "files": []}
+            with os.scandir(posts_dir / rel_dir) as it:
+                for item in it:
+                    rel_path = f"{rel_dir}{item.name}"
+                    if matches(rel_path, settings["exclude"]):
+                        continue
+                    if item.is_dir():
+                        entry["dirs"].append(f"{rel_path}/")
+                    elif matches(rel_path, settings["include"]):
+                        entry["files"].append(rel_path)
+
+        dirs[rel_dir] = entry
+        pending.extend(entry["dirs"])
+        candidates.extend(entry["files"])
+
+    # Only read the front matter of the posts that changed to know if they're published.
+    # Whether a post is in the future is worked out every time, since it changes by itself
+    files: dict[str, dict[str, Any]] = {}
+    for rel_path in candidates:
+        stat = (posts_dir / rel_path).stat()
+        entry = previous_files.get(rel_path, {})
+        if entry.get("mtime_ns") != stat.st_mtime_ns or entry.get("size") != stat.st_size:
+            entry = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+            entry |= read_status(posts_dir / rel_path)
+        files[rel_path] = entry
+
+    if save:
+        record_path.parent.mkdir(parents=True, exist_ok=True)
+        record_path.write_text(
+            json.dumps({"version": VERSION, "settings": settings, "dirs": dirs, "files": files}),
+            encoding="utf-8",
+        )
+
+    # Posts are known by their file name, so there can't be two with the same one
+    posts = [posts_dir / k for k, v in sorted(files.items()) if is_listed(v, settings)]
+    names: dict[str, Path] = {}
+    for post in posts:
+        if (other := names.setdefault(post.name, post)) != post:
+            raise RuntimeError(f"Posts {other} and {post} have the same file name")
+    return posts
@@ -1,5 +1,16 @@
+from .atom import generate_atom_feed
+from .generate import FEED_FILES, feed_items, feed_settings, feed_signature, save_feeds
 from .json import generate_json_feed
 from .rss import generate_rss_feed
 
 
-__all__ = ["generate_json_feed", "generate_rss_feed"]
+__all__ = [
+    "FEED_FILES",
+    "feed_items",
+    "feed_settings",
+    "feed_signature",
+    "generate_atom_feed",
+    "generate_json_feed",
+    "generate_rss_feed",
+    "save_feeds",
+]
@@ -0,0 +1,62 @@
+from datetime import UTC, datetime
+from typing import Any
+from xml.sax.saxutils import escape, quoteattr
+
+from src.app import config
+
+from ..helpers import asset_url
+
+
+__all__ = ["generate_atom_feed"]
+
+
+def generate_atom_feed(items: list[dict[str, Any]], /, full_content: bool = False) -> bytes:
+    """Generate an Atom feed of posts.
+
+    https://www.rfc-editor.org/rfc/rfc4287
+    """
+    # Get the site config info we need
+    site_meta = config.get("site")
+    global_post_meta = config.get("post")
+    domain = escape(site_meta["domain"])
+
+    # Define the base information
+    parts = [
+        (
+            "<?xml version='1.0' encoding='UTF-8'?>\n"
+            '<feed xmlns="http://www.w3.org/2005/Atom" xml:lang="en-US">'
+        ),
+        f"<id>{domain}/</id>",
+        f"<title>{escape(site_meta['title'])}</title>",
+        f"<subtitle>{escape(site_meta['subtitle'])}</subtitle>",
+        f"<link href={quoteattr(site_meta['domain'])}/>",
+        f'<link href={quoteattr(site_meta["domain"] + "/atom.xml")} rel="self"/>',
+        f"<icon>{domain}{escape(asset_url('favicon.png'))}</icon>",
+        f"<logo>{domain}{escape(asset_url('logo.svg'))}</logo>",
+    ]
+
+    # A feed must have an author, which is the site itself when posts don't have a default one
+    author = global_post_meta["defaults"].get("author") or site_meta["title"]
+    parts.append(f"<author><name>{escape(author)}</name></author>")
+
+    # The feed was last changed when its newest post was published,
+    # and a feed without any posts is only generated again when it gets one
+    updated = items[0]["published"] if items else datetime.now(UTC).replace(microsecond=0)
+    parts.append(f"<updated>{updated.isoformat()}</updated>")
+
+    for item in items:
+        parts.extend((
+            f"<entry><id>{escape(item['url'])}</id>",
+            f"<title>{escape(item['title'])}</title>",
+            f"<link href={quoteattr(item['url'])}/>",
+            f"<published>{item['published'].isoformat()}</published>",
+            f"<updated>{item['published'].isoformat()}</updated>",
+        ))
+        if item["subtitle"]:
+            parts.append(f"<summary>{escape(item['subtitle'])}</summary>")
+        if full_content:
+            parts.append(f'<content type="html">{escape(item["content"])}</content>')
+        parts.append("</entry>")
+
+    parts.append("</feed>")
+    return "".join(parts).encode()
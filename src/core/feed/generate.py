@@ -0,0 +1,100 @@
+import json
+from datetime import UTC, datetime, time
+from typing import Any
+
+from src.app import config, current_app
+
+from ..fingerprint import assets_changed
+from ..helpers import content_hash, record_assets
+from ..manifest import Manifest, write_output
+from .atom import generate_atom_feed
+from .json import generate_json_feed
+from .rss import generate_rss_feed
+
+
+__all__ = ["FEED_FILES", "feed_items", "feed_settings", "feed_signature", "save_feeds"]
+
+
+# The output file of each kind of feed
+FEED_FILES = {"rss": "feed.xml", "atom": "atom.xml", "json": "feed.json"}
+
+
+def feed_settings() -> dict[str, Any]:
+    """Get the feed config, filling in the defaults."""
+    settings = {"formats": ["rss", "json"], "items": 5, "full_content": False} | config.get("feeds")
+    if unknown := set(settings["formats"]) - FEED_FILES.keys():
+        raise RuntimeError(f"Unknown feed formats: {', '.join(sorted(unknown))}")
+    return settings
+
+
+def feed_items(posts: list, /) -> list[dict[str, Any]]:
+    """Describe the posts of a feed once, for every kind of feed to use."""
+    site_meta = config.get("site")
+    return [
+        {
+            "id": post.meta.slug,
+            "url": f"{site_meta['domain']}{post.meta.url}",
+            "title": post.meta.title,
+            "subtitle": post.meta.subtitle,
+            "published": datetime.combine(post.meta.date, time.min).replace(tzinfo=UTC),
+            "stats": post.meta.stats,
+            "content": post.content,
+        }
+        for post in posts
+    ]
+
+
+def feed_signature(posts: list, /, settings: dict[str, Any], content_hashes: dict[str, str]) -> str:
+    """Describe everything that goes into the feeds."""
+    return content_hash(
+        json.dumps(
+            {
+                "site": config.get("site"),
+                "defaults": config.get("post")["defaults"],
+                "settings": settings,
+                "posts": [(p.meta.to_dict(), content_hashes[p.file.name]) for p in posts],
+            },
+            default=str,
+            sort_keys=True,
+        )
+    )
+
+
+def save_feeds(all_posts: dict, /, content_hashes: dict[str, str]) -> set[str]:
+    """Generate and save every requested feed, returning their output file names.
+
+    The posts are expected to be sorted already, newest first. A feed is only generated again
+    when the posts in it, how it's set up, or the static files it links to changed since the last build.
+    """
+    manifest: Manifest = current_app()["build"]["manifest"]
+    settings = feed_settings()
+    posts = list(all_posts.values())[: settings["items"]]
+    signature = feed_signature(posts, settings=settings, content_hashes=content_hashes)
+
+    outputs = {FEED_FILES[fmt] for fmt in settings["formats"]}
+    output_dir = config.get("directories")["output_dir"]
+    asset_urls = current_app()["build"]["asset_urls"]
+    stale = [
+        k
+        for k in sorted(outputs)
+        if manifest.pages.get(k) != signature
+        or not (output_dir / k).exists()
+        or assets_changed(manifest.page_assets.get(k, {}), asset_urls)
+    ]
+    if not stale:
+        return outputs
+
+    # Every kind of feed is generated from the same description of its posts
+    items = feed_items(posts)
+    for key in stale:
+        with record_assets() as assets:
+            if key == FEED_FILES["rss"]:
+                data = generate_rss_feed(items, full_content=settings["full_content"])
+            elif key == FEED_FILES["atom"]:
+                data = generate_atom_feed(items, full_content=settings["full_content"])
+            else:
+                data = generate_json_feed(items)
+        write_output(output_dir / key, data)
+        manifest.pages[key] = signature
+        manifest.page_assets[key] = assets
+    return outputs
@@ -1,13 +1,15 @@
 import json
-from datetime import UTC, datetime, time
+from typing import Any
 
 from src.app import config
 
+from ..helpers import asset_url
+
 
 __all__ = ["generate_json_feed"]
 
 
-def generate_json_feed(all_posts: dict, /) -> str:
+def generate_json_feed(items: list[dict[str, Any]], /) -> bytes:
     """Generate a JSON feed of posts.
 
     https://www.jsonfeed.org/
@@ -24,27 +26,25 @@ def generate_json_feed(all_posts: dict, /) -> str:
         "home_page_url": site_meta["domain"],
         "feed_url": f"{site_meta['domain']}/feed.json",
         "language": "en-US",
-        "icon": f"{site_meta['domain']}/static/logo.svg",
-        "favicon": f"{site_meta['domain']}/static/favicon.png",
+        "icon": f"{site_meta['domain']}{asset_url('logo.svg')}",
+        "favicon": f"{site_meta['domain']}{asset_url('favicon.png')}",
     }
 
     # Add the default author's name if present
     if "author" in global_post_meta["defaults"]:
         feed["authors"] = [{"name": global_post_meta["defaults"]["author"]}]
 
-    # List the most recent 5 posts available
-    feed["items"] = []
-    for post in tuple(all_posts.values())[:5]:
-        item = {
-            "id": post.meta["slug"],
-            "url": f"{site_meta['domain']}{post.meta['url']}",
-            "title": post.meta["title"],
-            "subtitle": post.meta.get("subtitle", global_post_meta["defaults"]["subtitle"]),
-            "date_published": datetime.combine(post.meta["date"], time.min)
-            .replace(tzinfo=UTC)
-            .isoformat(),
-            "content_html": post.content,
+    # A JSON feed always has the content of its posts
+    feed["items"] = [
+        {
+            "id": item["id"],
+            "url": item["url"],
+            "title": item["title"],
+            "subtitle": item["subtitle"],
+            "date_published": item["published"].isoformat(),
+            "content_html": item["content"],
+            "_stats": item["stats"],
         }
-        feed["items"].append(item)
-
-    return json.dumps(feed)
+        for item in items
+    ]
+    return json.dumps(feed).encode()
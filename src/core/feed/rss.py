@@ -1,37 +1,62 @@
-from datetime import UTC, datetime, time
-
-from feedgen.feed import FeedGenerator
+from email.utils import format_datetime
+from typing import Any
+from xml.sax.saxutils import escape, quoteattr
 
 from src.app import config
 
+from ..helpers import asset_url
+
 
 __all__ = ["generate_rss_feed"]
 
 
-def generate_rss_feed(all_posts: dict, /) -> bytes:
-    """Generate a RSS feed of posts."""
+def generate_rss_feed(items: list[dict[str, Any]], /, full_content: bool = False) -> bytes:
+    """Generate a RSS 2.0 feed of posts.
+
+    https://www.rssboard.org/rss-specification
+    """
     # Get the site config info we need
     site_meta = config.get("site")
-    global_post_meta = config.get("post")
+    domain = escape(site_meta["domain"])
 
     # Define the base information
-    fg = FeedGenerator()
-    fg.id(site_meta["domain"])
-    fg.title(site_meta["title"])
-    fg.subtitle(site_meta["subtitle"])
-    fg.link(href=site_meta["domain"], rel="self")
-    fg.language("en-US")
-    fg.logo(f"{site_meta['domain']}/static/favicon.png")
-
-    # Add the default author's name if present
-    if "author" in global_post_meta["defaults"]:
-        fg.author({"name": global_post_meta["defaults"]["author"]})
-
-    # List the most recent 5 posts available
-    for post in tuple(all_posts.values())[:5]:
-        fe = fg.add_entry(order="append")
-        fe.id(post.meta["slug"])
-        fe.link(href=f"{site_meta['domain']}{post.meta['url']}")
-        fe.title(post.meta["title"])
-        fe.published(datetime.combine(post.meta["date"], time.min).replace(tzinfo=UTC).isoformat())
-    return fg.rss_str()
+    parts = [
+        (
+            "<?xml version='1.0' encoding='UTF-8'?>\n"
+            '<rss xmlns:atom="http://www.w3.org/2005/Atom" '
+            'xmlns:content="http://purl.org/rss/1.0/modules/content/" version="2.0"><channel>'
+        ),
+        f"<title>{escape(site_meta['title'])}</title>",
+        f"<link>{domain}</link>",
+        f"<description>{escape(site_meta['subtitle'])}</description>",
+        (
+            f'<atom:link href={quoteattr(site_meta["domain"] + "/feed.xml")} rel="self"'
+            ' type="application/rss+xml"/>'
+        ),
+        "<docs>http://www.rssboard.org/rss-specification</docs>",
+        (
+            f"<image><url>{domain}{escape(asset_url('favicon.png'))}</url>"
+            f"<title>{escape(site_meta['title'])}</title><link>{domain}</link></image>"
+        ),
+        "<language>en-US</language>",
+    ]
+
+    # The feed was last changed when its newest post was published
+    if items:
+        parts.append(f"<lastBuildDate>{format_datetime(items[0]['published'])}</lastBuildDate>")
+
+    for item in items:
+        parts.extend((
+            f"<item><title>{escape(item['title'])}</title>",
+            f"<link>{escape(item['url'])}</link>",
+            f'<guid isPermaLink="false">{escape(item["id"])}</guid>',
+            f"<pubDate>{format_datetime(item['published'])}</pubDate>",
+        ))
+        if item["subtitle"]:
+            parts.append(f"<description>{escape(item['subtitle'])}</description>")
+        if full_content:
+            parts.append(f"<content:encoded>{escape(item['content'])}</content:encoded>")
+        parts.append("</item>")
+
+    parts.append("</channel></rss>")
+    return "".join(parts).encode()
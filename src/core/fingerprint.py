@@ -0,0 +1,114 @@
+import json
+import os
+from pathlib import Path
+from typing import Any
+
+from src.app import config
+
+from .assets import (
+    asset_destinations,
+    copy_file,
+    hash_file,
+    is_current,
+    list_files,
+    load_record,
+    save_record,
+)
+
+
+__all__ = [
+    "MANIFEST_FILE",
+    "asset_urls",
+    "assets_changed",
+    "fingerprint_assets",
+    "hash_static_files",
+    "static_url",
+]
+
+
+# Where the fingerprinted URL of every static file is saved in the output directory
+MANIFEST_FILE = "asset-manifest.json"
+
+# How much of the content hash of a file goes into its fingerprinted name
+HASH_LENGTH = 10
+
+
+def static_url(name: str, /) -> str:
+    """Get the plain URL of a static file, by its path relative to the static directory."""
+    output_dir: Path = config.get("directories")["output_dir"]
+    return f"/{(asset_destinations()['static'] / name).relative_to(output_dir).as_posix()}"
+
+
+def hash_static_files(
+    previous: dict[str, dict[str, Any]], /
+) -> dict[str, tuple[dict[str, Any], os.stat_result]]:
+    """Hash every static file by its path relative to the static directory.
+
+    Hashing a file is only needed when it looks different than when it was last hashed.
+    """
+    static: Path = config.get("directories")["static"]
+    return {
+        name.as_posix(): (
+            hash_file(static / name, stat, previous=previous.get(name.as_posix(), {})),
+            stat,
+        )
+        for name, stat in list_files(static).items()
+    }
+
+
+def asset_urls(files: dict[str, tuple[dict[str, Any], os.stat_result]], /) -> dict[str, str]:
+    """Get the fingerprinted URL of every hashed static file, with its hash before its extension."""
+    urls: dict[str, str] = {}
+    for name, (entry, _) in files.items():
+        path = Path(name)
+        fingerprinted = path.with_name(f"{path.stem}.{entry['digest'][:HASH_LENGTH]}{path.suffix}")
+        urls[name] = static_url(fingerprinted.as_posix())
+    return urls
+
+
+def assets_changed(used: dict[str, str], urls: dict[str, str], /) -> bool:
+    """Determine if any of the static files a page linked to have a different URL since,
+    given the fingerprinted `urls` of this build."""
+    return any((urls.get(name) or static_url(name)) != url for name, url in used.items())
+
+
+def fingerprint_assets() -> tuple[dict[str, str], set[Path]]:
+    """Copy every static file to a name with its content hash in it, so it can be cached forever.
+
+    The fingerprinted URL of each file is returned by its path relative to the static directory,
+    along with every file written. The URLs are also saved in the output directory,
+    for servers to look up, and the copies that are no longer needed are removed.
+    """
+    # The manifest is built on the helpers, which link to static files with this module
+    from .manifest import write_output
+
+    all_directories: dict[str, Path] = config.get("directories")
+    output_dir = all_directories["output_dir"]
+    record = load_record("fingerprints")
+    files = hash_static_files(record.get("files", {}))
+    urls = asset_urls(files)
+
+    # The copies are left alone while they're the same as their source
+    outputs: set[Path] = set()
+    for name, (_, stat) in files.items():
+        source = all_directories["static"] / name
+        destination = output_dir / urls[name].lstrip("/")
+        if not is_current(source, stat, destination):
+            copy_file(source, destination)
+        outputs.add(destination)
+
+    # The manifest is written like any other output, so only when a URL changed
+    manifest_path = output_dir / MANIFEST_FILE
+    data = json.dumps({static_url(k): v for k, v in sorted(urls.items())}, indent=2).encode()
+    write_output(manifest_path, data)
+    outputs.add(manifest_path)
+
+    for path in {Path(p) for p in record.get("outputs", [])} - outputs:
+        path.unlink(missing_ok=True)
+
+    # Record what was hashed and written, so the next build knows what it's responsible for
+    save_record(
+        "fingerprints",
+        {"files": {k: v[0] for k, v in files.items()}, "outputs": sorted(str(p) for p in outputs)},
+    )
+    return urls, outputs
@@ -1,7 +1,13 @@
-import shutil
+import hashlib
+import re
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
 from datetime import date, datetime
 from math import floor
 from pathlib import Path
+from typing import TextIO
+from urllib.parse import quote_plus
 
 from src.app import config
 
@@ -9,63 +15,333 @@ from src.app import config
 __all__ = [
     "ALL_FILTERS",
     "ALL_GLOBALS",
+    "asset_url",
+    "content_hash",
     "duration",
     "make_dist",
-    "remove_falsey_items",
-    "replace_curly_quotes",
+    "normalise_text",
+    "read_front_matter",
+    "record_assets",
+    "slugify",
+    "tag_url",
 ]
 
 
+# The typographic characters each normalisation replaces, and what with
+NORMALISATIONS = {
+    "quotes": {"“": '"', "”": '"', "‘": "'", "’": "'"},
+    "dashes": {"–": "--", "—": "---"},
+    "ellipses": {"…": "..."},
+    "spaces": {"\u00a0": " ", "\u2009": " ", "\u202f": " "},
+}
+
+# Inline code in Markdown, between two runs of the same number of backticks in the same paragraph
+RE_CODE_SPAN = re.compile(r"(`+)(?!`)(?:.|\n(?![ \t]*(?:\n|$)))+?(?<!`)\1(?!`)")
+
+# What can come before a fence on its line: any indent, like in a list, or a quote or list marker
+RE_FENCE_PREFIX = re.compile(r"[ \t>]*(?:(?:[-+*]|\d{1,9}[.)])[ \t]+)?")
+
+# The start of a line indented enough to be code, after the line before
+RE_INDENTED_LINE = re.compile(r"\n(?:    |\t)")
+
+# The start of a line in a quote or list, where indented text may not be code
+RE_BLOCK_MARKER = re.compile(r">|(?:[-+*]|\d{1,9}[.)])(?:[ \t]|$)")
+
+
 def current_year() -> int:
     """Get the current year."""
     return date.today().year
 
 
-def duration(seconds: int) -> str:
+def content_hash(data: bytes | str) -> str:
+    """Generate a stable hash of some content."""
+    if isinstance(data, str):
+        data = data.encode()
+    return hashlib.sha256(data).hexdigest()
+
+
+def duration(seconds: float) -> str:
     """Taken from https://stackoverflow.com/a/3856312"""
     hours = floor(seconds / 3600)
     mins = floor(seconds / 60 % 60)
-    secs = floor(seconds % 60)
+    secs = seconds % 60
 
     # Only display the hours if needed
     if hours > 0:
-        return f"{hours:02d}:{mins:02d}:{secs:02d}"
-    return f"{mins:02d}:{secs:02d}"
+        return f"{hours:02d}:{mins:02d}:{secs:06.3f}"
+    return f"{mins:02d}:{secs:06.3f}"
+
+
+def read_front_matter(f: TextIO) -> str:
+    """Read the front matter from the start of an open file.
+
+    The file is left positioned at the start of the content. If there is
+    no front matter, an empty string is returned.
+    """
+    # Skip over any blank lines before the opening fence
+    for line in f:
+        if line.strip():
+            break
+    else:
+        return ""
+
+    # The front matter must be fenced by a line of at least three `-` or `+`
+    fence = line.rstrip()
+    if len(fence) < 3 or fence[0] not in "-+" or fence.strip(fence[0]):
+        return ""
+
+    # Collect everything up to the matching closing fence
+    meta: list[str] = []
+    for line in f:
+        if line.rstrip() == fence:
+            return "".join(meta)
+        meta.append(line)
+    return ""
+
+
+def text_replacements() -> tuple[tuple[str, str], ...]:
+    """Get the typographic characters to replace in posts, and what to replace them with."""
+    names: list[str] = config.get("typography").get("normalise", ["quotes"])
+    if unknown := set(names) - NORMALISATIONS.keys():
+        raise RuntimeError(f"Unknown typography normalisations: {', '.join(sorted(unknown))}")
+    return tuple(pair for name in names for pair in NORMALISATIONS[name].items())
+
+
+def normalise_text(text: str, /, skip_code: bool = False) -> str:
+    """Replace the typographic characters in some text that are meant to be plain ones.
+
+    With `skip_code`, the text is Markdown, and code, in blocks and inline, is left exactly
+    as it is. Text that doesn't need any replacements is returned as it is, without being copied.
+    """
+    # Every character that's replaced is outside of ASCII
+    if text.isascii():
+        return text
+
+    # Only the characters that are in the text are replaced. `str.translate` would go
+    # through the text one character at a time in Python, which is many times slower
+    replacements = [(old, new) for old, new in text_replacements() if old in text]
+    if not replacements:
+        return text
+    if not skip_code:
+        return replace_all(text, replacements)
+
+    # Code rarely has anything to replace, and then the whole text is normalised at once.
+    # Otherwise, only the prose around the code is, a piece at a time
+    code = code_ranges(text)
+    if not any(text.find(old, start, end) != -1 for start, end in code for old, _ in replacements):
+        return replace_all(text, replacements)
+    parts: list[str] = []
+    prose_start = 0
+    for start, end in code:
+        parts.extend((replace_all(text[prose_start:start], replacements), text[start:end]))
+        prose_start = end
+    parts.append(replace_all(text[prose_start:], replacements))
+    return "".join(parts)
+
+
+def replace_all(text: str, replacements: list[tuple[str, str]], /) -> str:
+    """Make every replacement in some text, which is only copied for those that are in it."""
+    for old, new in replacements:
+        text = text.replace(old, new)
+    return text
+
+
+def fence_lines(text: str, /) -> list[tuple[int, int, str, str]]:
+    """Find every line of Markdown that could open or close a fenced code block.
+
+    Each is given as where the line starts and ends, its fence, and the info string after it.
+    Looking for the fence characters is much faster than matching every line.
+    """
+    lines = []
+    for char in "`~":
+        fence = char * 3
+        pos = text.find(char)
+        while pos != -1:
+            # Most backticks are inline code, which is skipped over right away
+            if not text.startswith(fence, pos):
+                pos = text.find(char, pos + 1)
+                continue
+
+            # Only the first fence on a line can be one, and only when nothing but its indent is before it
+            line_start = text.rfind("\n", 0, pos) + 1
+            line_end = text.find("\n", pos)
+            line_end = len(text) if line_end == -1 else line_end
+            prefix = text[line_start:pos]
+            if not prefix.strip(" ") or RE_FENCE_PREFIX.fullmatch(prefix):
+                line = text[pos:line_end]
+                end = pos + len(line) - len(line.lstrip(char))
+                lines.append((line_start, line_end, text[pos:end], text[end:line_end]))
+            pos = text.find(char, line_end)
+    return sorted(lines)
+
+
+def fenced_code_blocks(text: str, /) -> Iterator[tuple[int, int]]:
+    """Find where each fenced code block in some Markdown starts and ends.
+
+    A code block that's never closed runs to the end of the text, as it does in CommonMark.
+    """
+    opening: tuple[int, int, str, str] | None = None
+    for line in fence_lines(text):
+        _, line_end, fence, info = line
+        if opening is None:
+            # Backtick fences can't have backticks in their info string
+            if fence[0] == "~" or "`" not in info:
+                opening = line
+        elif fence[0] == opening[2][0] and len(fence) >= len(opening[2]) and not info.strip():
+            yield opening[0], line_end
+            opening = None
 
+    if opening is not None:
+        yield opening[0], len(text)
 
-def remove_falsey_items(li: list) -> list:
-    """Remove falsey items from a list."""
-    return [v for v in li if v]
 
+def indented_code_blocks(text: str, start: int, end: int, /) -> Iterator[tuple[int, int]]:
+    """Find where each indented code block in part of some Markdown starts and ends.
 
-def replace_curly_quotes(text: str) -> str:
-    """Replace any curly quotes in the text with straight quotes."""
-    return text.replace("“", '"').replace("”", '"').replace("‘", "'").replace("’", "'")
+    Only the blocks after a blank line that follows unindented text outside of a quote or list
+    are found, or right after a fenced code block. Elsewhere, indented text can just as well
+    continue a paragraph or a list item, which would take rendering the Markdown to tell apart.
+    """
+    pos = start
+    while (block_start := next_indented_line(text, pos, end)) != -1:
+        pos = text.find("\n", block_start, end)
+        pos = end if pos == -1 else pos
+
+        # Whether it's code depends on the last line with text before it, which can be before
+        # `start`, like the end of a fenced code block. Otherwise, there has to be a blank line
+        line_start = block_start
+        blank = False
+        while line_start > 0:
+            previous_start = text.rfind("\n", 0, line_start - 1) + 1
+            previous = text[previous_start : line_start - 1]
+            if previous.strip():
+                break
+            blank = True
+            line_start = previous_start
+        else:
+            previous = ""
+            blank = True
+        if not (blank or 0 < start == line_start - 1) or (
+            previous.startswith((" ", "\t")) or RE_BLOCK_MARKER.match(previous)
+        ):
+            continue
+
+        # The block goes on through blank lines, up to the last indented one
+        block_end = pos
+        while pos < end:
+            line_end = text.find("\n", pos + 1, end)
+            line_end = end if line_end == -1 else line_end
+            line = text[pos + 1 : line_end]
+            if line.startswith(("    ", "\t")):
+                block_end = line_end
+            elif line.strip():
+                break
+            pos = line_end
+        yield block_start, block_end
+        pos = block_end
+
+
+def next_indented_line(text: str, start: int, end: int, /) -> int:
+    """Find where the next line indented enough to be code starts, or -1 if there's none."""
+    if start == 0 and text.startswith(("    ", "\t")):
+        return 0
+    match = RE_INDENTED_LINE.search(text, start, end)
+    return -1 if match is None else match.start() + 1
+
+
+def code_blocks(text: str, /) -> Iterator[tuple[int, int]]:
+    """Find where each code block in some Markdown starts and ends, both fenced and indented."""
+    start = 0
+    for block_start, block_end in [*fenced_code_blocks(text), (len(text), len(text))]:
+        yield from indented_code_blocks(text, start, block_start)
+        if block_start < block_end:
+            yield block_start, block_end
+        start = block_end
+
+
+def code_ranges(text: str, /) -> list[tuple[int, int]]:
+    """Find where all of the code in some Markdown starts and ends, in blocks and inline."""
+    ranges: list[tuple[int, int]] = []
+    start = 0
+    for block_start, block_end in [*code_blocks(text), (len(text), len(text))]:
+        if text.find("`", start, block_start) != -1:
+            ranges.extend(span.span() for span in RE_CODE_SPAN.finditer(text, start, block_start))
+        if block_start < block_end:
+            ranges.append((block_start, block_end))
+        start = block_end
+    return ranges
+
+
+def split_code_blocks(text: str, /) -> Iterator[tuple[str, str]]:
+    """Split Markdown into pairs of the text before each code block and the block itself.
+
+    The last pair has the text after the last code block, and no code.
+    """
+    start = 0
+    for block_start, block_end in code_blocks(text):
+        yield text[start:block_start], text[block_start:block_end]
+        start = block_end
+    yield text[start:], ""
+
+
+def slugify(text: str) -> str:
+    """Generate a URL-safe slug from some text."""
+    return quote_plus("-".join(m.lower() for m in re.findall(r"\w+", text.replace("'", ""))))
+
+
+def tag_url(tag: str) -> str:
+    """Generate the URL of a tag's post index."""
+    return f"/tag/{slugify(tag)}"
+
+
+# The static files linked to while rendering a page, along with their URLs
+ASSETS_USED: ContextVar[dict[str, str] | None] = ContextVar("assets_used", default=None)
+
+
+def asset_url(name: str) -> str:
+    """Generate the URL of a static file, from its path relative to the static directory.
+
+    When the static files are fingerprinted, the URL has the file's content hash in it.
+    """
+    # The app imports this module to set up the templates, so neither can be imported up front
+    from src.app import current_app
+
+    from .fingerprint import static_url
+
+    url = current_app()["build"]["asset_urls"].get(name) or static_url(name)
+    if (used := ASSETS_USED.get()) is not None:
+        used[name] = url
+    return url
+
+
+@contextmanager
+def record_assets() -> Iterator[dict[str, str]]:
+    """Record every static file linked to with `asset_url()` while rendering a page.
+
+    Only the pages linking to a static file need to change when its URL does.
+    """
+    used: dict[str, str] = {}
+    token = ASSETS_USED.set(used)
+    try:
+        yield used
+    finally:
+        ASSETS_USED.reset(token)
 
 
 def make_dist() -> None:
     """Create all of the required directories."""
-    all_directories: dict[str, Path] = config.get("directories")
-    dist_path: Path = all_directories["output_dir"]
+    # The asset modules need the app, which imports this module, so it can't be imported up front
+    from .assets import sync_assets
+
+    dist_path: Path = config.get("directories")["output_dir"]
 
-    # Delete any previous site generation first
-    if dist_path.exists():
-        shutil.rmtree(dist_path)
+    # Copy over the media directory, the site static files, and all of the site root files.
+    # Only what changed since the previous site generation is copied
+    print(f"Assets: {sync_assets()}")
 
     # Create the directory the notes live in
     (dist_path / config.get("post")["output_dir"]).mkdir(parents=True, exist_ok=True)
 
-    # Create the media directory
-    shutil.copytree(
-        all_directories["media"], (dist_path / all_directories["media"].stem), dirs_exist_ok=True
-    )
-
-    # Create the site static files folders and files
-    shutil.copytree(all_directories["static"], (dist_path / "static"), dirs_exist_ok=True)
-
-    # Copy all of the site root files
-    shutil.copytree(all_directories["root"], (dist_path), dirs_exist_ok=True)
-
 
 def format_datetime(dt: datetime, fmt: str) -> str:
     """Format a datetime object to a datestring."""
@@ -79,4 +355,9 @@ def intcomma(val: int) -> str:
 
 
 ALL_FILTERS = {"intcomma": intcomma}
-ALL_GLOBALS = {"current_year": current_year(), "format_datetime": format_datetime}
+ALL_GLOBALS = {
+    "current_year": current_year(),
+    "format_datetime": format_datetime,
+    "tag_url": tag_url,
+    "asset_url": asset_url,
+}
@@ -0,0 +1,207 @@
+import json
+import os
+from collections.abc import Iterator
+from pathlib import Path
+from typing import Any
+from urllib.parse import quote
+
+from src.app import config
+
+from .assets import (
+    asset_destinations,
+    copy_file,
+    hash_file,
+    is_current,
+    list_files,
+    load_record,
+    looks_unchanged,
+    save_record,
+)
+from .helpers import content_hash
+
+
+__all__ = [
+    "IMAGE_SUFFIXES",
+    "changed_images",
+    "image_settings",
+    "images_changed",
+    "process_image",
+    "sync_images",
+]
+
+
+# Bump this whenever images are processed differently, so the cached ones are replaced
+VERSION = 2
+
+# The kinds of images that can be resized
+IMAGE_SUFFIXES = (".png", ".jpg", ".jpeg", ".webp")
+
+# The MIME type of each format resized images can be saved in
+IMAGE_FORMATS = {"webp": "image/webp", "avif": "image/avif"}
+
+
+def image_settings() -> dict[str, Any]:
+    """Get the responsive images config, filling in the defaults."""
+    settings = {"widths": [480, 960, 1600], "formats": ["webp"], "quality": 80, "sizes": "100vw"}
+    settings |= config.get("images")
+    if unknown := set(settings["formats"]) - IMAGE_FORMATS.keys():
+        raise RuntimeError(f"Unknown image formats: {', '.join(sorted(unknown))}")
+    return settings
+
+
+def process_image(job: tuple[Path, Path, dict[str, Any]], /) -> dict[str, Any] | None:
+    """Resize and re-encode an image into every width and format it's needed in.
+
+    Images are never made larger than they are. Nothing is returned
+    if the image can't be read, so it can be used as it is instead.
+    """
+    from PIL import Image, ImageOps, UnidentifiedImageError
+
+    source, directory, settings = job
+    try:
+        image = Image.open(source)
+        image.load()
+    except (UnidentifiedImageError, OSError):
+        return None
+
+    # Cameras save photos sideways and say which way is up, which is lost once re-encoded
+    image = ImageOps.exif_transpose(image)
+
+    # Every image is resized down to the widths it's larger than, along with its own width
+    width, height = image.size
+    widths = sorted({w for w in settings["widths"] if w < width} | {width})
+    directory.mkdir(parents=True, exist_ok=True)
+    variants = []
+    for w in widths:
+        resized = image if w == width else image.resize((w, round(height * w / width)))
+        for fmt in settings["formats"]:
+            path = directory / f"{w}.{fmt}"
+            if not path.exists():
+                temp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+                resized.save(temp_path, format=fmt.upper(), quality=settings["quality"])
+                temp_path.replace(path)
+            variants.append({"format": fmt, "width": w, "file": path.name})
+    return {"width": width, "height": height, "variants": variants}
+
+
+def image_sources() -> Iterator[tuple[str, Path, os.stat_result]]:
+    """Find every image that can be resized, along with its URL."""
+    media: Path = config.get("directories")["media"]
+    url_base = f"/{asset_destinations()['media'].name}"
+    for name, stat in list_files(media).items():
+        if name.suffix.lower() in IMAGE_SUFFIXES:
+            yield f"{url_base}/{name.as_posix()}", media / name, stat
+
+
+def settings_key(settings: dict[str, Any], /) -> str:
+    return content_hash(json.dumps(settings | {"version": VERSION}, sort_keys=True))[:16]
+
+
+def changed_images() -> set[str]:
+    """Find the URL of every image that looks different than when it was last processed.
+
+    Nothing is hashed or processed. When images are to be resized differently, every image
+    counts as changed, and removed images count too.
+    """
+    settings_hash = settings_key(image_settings())
+    previous: dict[str, dict[str, Any]] = load_record("images").get("images", {})
+    current = {url: stat for url, _, stat in image_sources()}
+    return {
+        url
+        for url in current.keys() | previous.keys()
+        if (entry := previous.get(url)) is None
+        or (stat := current.get(url)) is None
+        or not looks_unchanged(entry, stat)
+        or not entry["key"].endswith(f"-{settings_hash}")
+    }
+
+
+def sync_images(jobs: int) -> tuple[dict[str, dict[str, Any]], set[Path]]:
+    """Resize every image in the media directory.
+
+    How to display each image is returned by its URL, along with every resized image file.
+
+    The resized images are kept in a cache, addressed by the content of their source
+    image and how they're resized, so an image is only processed when it changes.
+    They're then copied next to the source image in the output directory.
+    """
+    all_directories: dict[str, Path] = config.get("directories")
+    settings = image_settings()
+    settings_hash = settings_key(settings)
+    record = load_record("images")
+    previous: dict[str, dict[str, Any]] = record.get("images", {})
+
+    # Hashing an image is only needed when it looks different than last time
+    images: dict[str, dict[str, Any]] = {}
+    pending: dict[str, tuple[Path, Path, dict[str, Any]]] = {}
+    for url, source, stat in image_sources():
+        entry = hash_file(source, stat, previous=previous.get(url, {}))
+        key = f"{entry['digest'][:32]}-{settings_hash}"
+        directory = all_directories["cache"] / "images" / key[:2] / key
+        images[url] = entry | {"key": key}
+        if (
+            entry.get("key") != key
+            or "info" not in entry
+            or (entry["info"] is not None and not directory.is_dir())
+        ):
+            pending[url] = (source, directory, settings)
+
+    # Only the new and changed images need to be processed, spread across processes
+    if jobs > 1 and len(pending) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+
+        from .pool import worker_context
+
+        with ProcessPoolExecutor(max_workers=jobs, mp_context=worker_context()) as executor:
+            results = dict(zip(pending, executor.map(process_image, pending.values()), strict=True))
+    else:
+        results = {url: process_image(job) for url, job in pending.items()}
+    for url, info in results.items():
+        images[url]["info"] = info
+
+    # Put the resized images next to their source in the output directory,
+    # and remove the ones that are no longer needed
+    index: dict[str, dict[str, Any]] = {}
+    outputs: set[Path] = set()
+    output_dir: Path = all_directories["output_dir"]
+    for url, entry in images.items():
+        if entry["info"] is None:
+            continue
+
+        directory = all_directories["cache"] / "images" / entry["key"][:2] / entry["key"]
+        stem = url.rsplit(".", 1)[0]
+        srcset: dict[str, list[str]] = {}
+        for variant in entry["info"]["variants"]:
+            variant_url = f"{stem}.{entry['key'][:8]}.{variant['width']}w.{variant['format']}"
+            source = directory / variant["file"]
+            destination = output_dir / variant_url.lstrip("/")
+            if not is_current(source, source.stat(), destination):
+                copy_file(source, destination)
+            outputs.add(destination)
+            # Image names can have spaces, which would split the URL in a `srcset`
+            srcset.setdefault(variant["format"], []).append(
+                f"{quote(variant_url)} {variant['width']}w"
+            )
+
+        index[url] = {
+            "key": entry["key"],
+            "width": entry["info"]["width"],
+            "height": entry["info"]["height"],
+            "sizes": settings["sizes"],
+            "sources": [
+                {"type": IMAGE_FORMATS[fmt], "srcset": ", ".join(srcset[fmt])}
+                for fmt in settings["formats"]
+            ],
+        }
+
+    for path in {Path(p) for p in record.get("outputs", [])} - outputs:
+        path.unlink(missing_ok=True)
+
+    # Record what was processed, so the next build knows what it's responsible for
+    save_record("images", {"images": images, "outputs": sorted(str(p) for p in outputs)})
+    return index, outputs
+
+
+def images_changed(used: dict[str, str | None], index: dict[str, dict[str, Any]], /) -> bool:
+    """Determine if any of the images a post used were resized differently since."""
+    return any(index.get(url, {}).get("key") != key for url, key in used.items())
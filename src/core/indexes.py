@@ -0,0 +1,199 @@
+import json
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+from typing import Any
+
+from src.app import config, current_app
+
+from .fingerprint import assets_changed
+from .helpers import content_hash, record_assets, tag_url
+from .manifest import Manifest, write_output
+from .pool import minify_pages
+from .profiler import current_profiler
+
+
+__all__ = [
+    "all_index_pages",
+    "index_pages",
+    "index_signature",
+    "output_to_url",
+    "post_signatures",
+    "render_index",
+    "save_index_pages",
+    "tag_index",
+    "url_to_output",
+]
+
+
+def index_pages(posts: list, /, url: str, per_page: int) -> list[dict[str, Any]]:
+    """Split the posts of an index into pages of `per_page` posts each.
+
+    The first page is at `url`, and every page after it at `{url}/page/{n}`.
+    A `per_page` of 0 puts every post on the first page.
+    """
+    pages = [posts[i : i + per_page] for i in range(0, len(posts), per_page)] if per_page else []
+    if not pages:
+        pages = [posts]
+
+    urls = [url] + [f"{url.rstrip('/')}/page/{n}" for n in range(2, len(pages) + 1)]
+    return [
+        {
+            "posts": page,
+            "pagination": {
+                "page": n,
+                "pages": len(pages),
+                "url": urls[n - 1],
+                "previous": urls[n - 2] if n > 1 else None,
+                "next": urls[n] if n < len(pages) else None,
+            },
+        }
+        for n, page in enumerate(pages, start=1)
+    ]
+
+
+def tag_index(posts: Iterable, /) -> dict[str, list]:
+    """Group the posts by each of their tags, keeping them in order.
+
+    Every tag needs a URL of its own, so tags that only differ in punctuation or case,
+    like `#C`, `#C++`, and `#c`, aren't allowed.
+    """
+    tags: dict[str, list] = {}
+    for post in posts:
+        for tag in post.meta.tags:
+            tags.setdefault(tag, []).append(post)
+
+    urls: dict[str, list[str]] = {}
+    for tag in tags:
+        urls.setdefault(tag_url(tag), []).append(tag)
+    if collisions := [(url, names) for url, names in urls.items() if len(names) > 1]:
+        raise RuntimeError(
+            "Tags can't share a URL: "
+            + "; ".join(f"{', '.join(sorted(names))} are all at {url}" for url, names in collisions)
+        )
+    return tags
+
+
+def all_index_pages(posts: list, /) -> Iterator[tuple[str, dict[str, Any]]]:
+    """Go through every page of the post index, and of the index of each tag if there are any.
+
+    Each page is given along with its kind, `index` or `tag`.
+    """
+    # The post index is the home page, unless there's a distinct one
+    post_index_url = (
+        f"/{config.get('post')['output_dir']}/"
+        if "home_template" in config.get("site")["pages"]
+        else "/"
+    )
+    per_page: int = config.get("post").get("per_page", 0)
+    for ctx in index_pages(posts, url=post_index_url, per_page=per_page):
+        yield "index", ctx
+
+    if "tag_template" in config.get("post"):
+        for tag, tagged_posts in tag_index(posts).items():
+            for ctx in index_pages(tagged_posts, url=tag_url(tag), per_page=per_page):
+                ctx["tag"] = tag
+                yield "tag", ctx
+
+
+def url_to_output(url: str, /) -> Path:
+    """Get the output file of a page URL."""
+    url = url.lstrip("/")
+    if not url or url.endswith("/"):
+        return config.get("directories")["output_dir"] / url / "index.html"
+    return config.get("directories")["output_dir"] / f"{url}.html"
+
+
+def output_to_url(key: str, /) -> str:
+    """Get the page URL of an output file, the reverse of `url_to_output()`."""
+    if key == "index.html" or key.endswith("/index.html"):
+        return f"/{key.removesuffix('index.html')}"
+    return f"/{key.removesuffix('.html')}"
+
+
+def post_signatures(posts: Iterable, /, content_hashes: dict[str, str]) -> dict[str, str]:
+    """Describe everything about each post that goes into the pages listing it.
+
+    A post is listed on several pages when there are tag pages,
+    so it's only described once for all of them.
+    """
+    return {
+        p.file.name: content_hash(
+            json.dumps([p.meta.to_dict(), content_hashes[p.file.name]], default=str, sort_keys=True)
+        )
+        for p in posts
+    }
+
+
+def index_signature(
+    ctx: dict[str, Any], /, templates: dict[str, str], signatures: dict[str, str]
+) -> str:
+    """Describe everything that goes into a page of an index, given the `post_signatures()`."""
+    return content_hash(
+        json.dumps(
+            {
+                "templates": templates,
+                "pagination": ctx["pagination"],
+                "tag": ctx.get("tag"),
+                "posts": [signatures[p.file.name] for p in ctx["posts"]],
+            },
+            default=str,
+            sort_keys=True,
+        )
+    )
+
+
+def render_index(
+    page_model, ctx: dict[str, Any], /, templates: dict[str, str], signatures: dict[str, str]
+) -> tuple[str, str | None]:
+    """Render a page of an index, returning its output file name and HTML.
+
+    If none of the posts on the page, the `templates` it is rendered with, nor the static files
+    it links to changed since the last build, the page isn't rendered, and has no HTML.
+    """
+    manifest: Manifest = current_app()["build"]["manifest"]
+    path = url_to_output(ctx["pagination"]["url"])
+    key = path.relative_to(config.get("directories")["output_dir"]).as_posix()
+    signature = index_signature(ctx, templates=templates, signatures=signatures)
+    if (
+        manifest.pages.get(key) == signature
+        and path.exists()
+        and not assets_changed(
+            manifest.page_assets.get(key, {}), current_app()["build"]["asset_urls"]
+        )
+    ):
+        return key, None
+    manifest.pages[key] = signature
+    with record_assets() as assets:
+        html = page_model.to_html(ctx)
+    manifest.page_assets[key] = assets
+    return key, html
+
+
+def save_index_pages(
+    pages: Iterable[tuple[str, str | None]], /, jobs: int, batch_size: int = 256
+) -> set[str]:
+    """Minify and save rendered index pages, returning the output file names of all of them.
+
+    Pages are minified `batch_size` at a time, spread across `jobs` processes,
+    so that there are never too many of them waiting in memory.
+    """
+    outputs: set[str] = set()
+    batch: list[tuple[str, str]] = []
+    for key, html in pages:
+        outputs.add(key)
+        if html is not None:
+            batch.append((key, html))
+        if len(batch) >= batch_size:
+            write_index_batch(batch, jobs)
+            batch = []
+    write_index_batch(batch, jobs)
+    return outputs
+
+
+def write_index_batch(batch: list[tuple[str, str]], /, jobs: int) -> None:
+    """Minify and save a batch of rendered index pages."""
+    output_dir: Path = config.get("directories")["output_dir"]
+    for key, data in minify_pages(batch, jobs=jobs if config.get("minify") else 1):
+        with current_profiler().stage("write"):
+            (output_dir / key).parent.mkdir(parents=True, exist_ok=True)
+            write_output(output_dir / key, data)
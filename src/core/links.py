@@ -0,0 +1,95 @@
+import json
+from dataclasses import dataclass, field
+from pathlib import Path
+from urllib.parse import unquote, urlsplit
+
+
+__all__ = ["LinkIndex"]
+
+
+@dataclass(slots=True)
+class LinkIndex:
+    """Resolve the internal links between posts, keeping track of which posts link to which.
+
+    An internal link is one to the file name of a post, in any of the ways it can
+    be written: with or without a path, `.md` extension, anchor, or percent-encoding.
+    Every relative link is recorded as one, even when no post has that name yet, so
+    that creating the post later updates the links to it.
+    """
+
+    urls: dict[str, str]
+    links: dict[str, dict[str, str | None]] = field(default_factory=dict)
+    backlinks: dict[str, set[str]] = field(default_factory=dict)
+
+    def target(self, href: str, /) -> tuple[str, str] | None:
+        """Get the post file name and anchor a relative link points to, whether or not the post exists."""
+        parts = urlsplit(href)
+        if parts.scheme or parts.netloc or not parts.path:
+            return None
+
+        name = unquote(parts.path).rsplit("/", 1)[-1]
+        if not name:
+            return None
+        if name not in self.urls and not name.endswith(".md"):
+            name = f"{name}.md"
+        return name, parts.fragment
+
+    def url(self, href: str, /) -> str | None:
+        """Get the URL an internal link points to, or nothing if the post doesn't exist."""
+        if (target := self.target(href)) is None or (url := self.urls.get(target[0])) is None:
+            return None
+        return f"{url}#{target[1]}" if target[1] else url
+
+    def add(self, source: str, links: dict[str, str | None], /) -> None:
+        """Record the internal links a post made, replacing the ones it made before."""
+        self.remove(source)
+        self.links[source] = links
+        for href in links:
+            if (target := self.target(href)) is not None:
+                self.backlinks.setdefault(target[0], set()).add(source)
+
+    def remove(self, source: str, /) -> None:
+        """Forget the internal links a post made."""
+        for href in self.links.pop(source, {}):
+            if (target := self.target(href)) is not None:
+                self.backlinks.get(target[0], set()).discard(source)
+
+    def moved(self, previous_urls: dict[str, str | None], /) -> set[str]:
+        """Get every post that links to a post that moved, appeared, or disappeared.
+
+        `previous_urls` are the URLs of every post when the links were recorded.
+        """
+        moved = {
+            name
+            for name in self.urls.keys() | previous_urls.keys()
+            if self.urls.get(name) != previous_urls.get(name)
+        }
+        return set().union(*(self.backlinks.get(name, ()) for name in moved))
+
+    def broken(self) -> list[tuple[str, str]]:
+        """List every link to a `.md` file that isn't a post, along with the post it's in.
+
+        Links without the extension aren't reported, as they could be to anything else.
+        """
+        return sorted(
+            (source, href)
+            for source, links in self.links.items()
+            for href in links
+            if self.url(href) is None and unquote(urlsplit(href).path).endswith(".md")
+        )
+
+    def save_report(self, path: Path, /) -> list[tuple[str, str]]:
+        """Save the backlinks of every post and the broken links, returning the broken links."""
+        broken = self.broken()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(
+            json.dumps(
+                {
+                    "backlinks": {k: sorted(v) for k, v in sorted(self.backlinks.items()) if v},
+                    "broken": [{"post": source, "href": href} for source, href in broken],
+                },
+                indent=2,
+            ),
+            encoding="utf-8",
+        )
+        return broken
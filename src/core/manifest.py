@@ -0,0 +1,292 @@
+import json
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+from src.app import config, current_app, get_renderer
+
+from . import stats
+from .helpers import content_hash
+from .links import LinkIndex
+from .minify import COMPRESSION_FORMATS, compressed_siblings
+
+
+__all__ = [
+    "Manifest",
+    "build_fingerprint",
+    "build_inputs",
+    "link_posts",
+    "page_templates",
+    "stale_posts",
+    "template_chain",
+    "write_output",
+]
+
+
+if TYPE_CHECKING:
+    from jinja2 import Environment
+
+
+def template_chain(jinja: "Environment", name: str, /) -> dict[str, str]:
+    """Hash a template and every template it extends or includes."""
+    from jinja2.meta import find_referenced_templates
+
+    chain: dict[str, str] = {}
+    pending = [name]
+    while pending:
+        template_name = pending.pop()
+        if template_name in chain:
+            continue
+
+        # Hash the raw template source, then queue up everything it references.
+        # Dynamic references (e.g., `{% extends var %}`) are reported as `None` and skipped
+        source = jinja.loader.get_source(jinja, template_name)[0]
+        chain[template_name] = content_hash(source)
+        pending.extend(t for t in find_referenced_templates(jinja.parse(source)) if t)
+    return chain
+
+
+# The parts of the config that affect every rendered post
+FINGERPRINT_CONFIG = (
+    "site",
+    "post",
+    "directories",
+    "minify",
+    "minify_threshold",
+    "precompress",
+    "responsive_images",
+    "images",
+)
+
+
+def build_inputs() -> dict[str, str]:
+    """Describe everything that affects every rendered post, each part by a hash of it."""
+    jinja: Environment = get_renderer("jinja")
+    inputs = {
+        f"config {k}": content_hash(json.dumps(config.get(k), default=str, sort_keys=True))
+        for k in FINGERPRINT_CONFIG
+    }
+    inputs |= {
+        f"template {k}": v
+        for k, v in template_chain(jinja, config.get("post")["post_template"]).items()
+    }
+    inputs["stats"] = str(stats.VERSION)
+    return inputs
+
+
+def build_fingerprint(inputs: dict[str, str], /) -> str:
+    """Fingerprint everything that affects every rendered post."""
+    return content_hash(json.dumps(inputs, sort_keys=True))
+
+
+def page_templates() -> dict[str, dict[str, str]]:
+    """Hash the template of every kind of page, along with every template it extends or includes.
+
+    The kinds are `post`, `index`, `tag` when there are tag pages, and the key of every site page.
+    """
+    jinja: Environment = get_renderer("jinja")
+    post_config = config.get("post")
+    names = {"post": post_config["post_template"], "index": post_config["index_template"]}
+    if "tag_template" in post_config:
+        names["tag"] = post_config["tag_template"]
+    names |= config.get("site")["pages"]
+    return {kind: template_chain(jinja, name) for kind, name in names.items()}
+
+
+@dataclass(slots=True)
+class Manifest:
+    """Record what the previous build produced, and from what.
+
+    Along with the fingerprint, the `inputs` it was made from and the `templates` of every
+    kind of page are kept, so that what changed since can be pointed out.
+    The static files every page other than a post linked to are kept in `page_assets`.
+    """
+
+    path: Path
+    fingerprint: str = ""
+    inputs: dict[str, str] = field(default_factory=dict)
+    templates: dict[str, str] = field(default_factory=dict)
+    posts: dict[str, dict[str, Any]] = field(default_factory=dict)
+    outputs: dict[str, str] = field(default_factory=dict)
+    pages: dict[str, str] = field(default_factory=dict)
+    page_assets: dict[str, dict[str, str]] = field(default_factory=dict)
+
+    @classmethod
+    def load(cls, path: Path, /, fingerprint: str) -> "Manifest":
+        """Load the previous build manifest."""
+        manifest = cls(path, fingerprint=fingerprint)
+        if not path.exists():
+            return manifest
+
+        # If the manifest was made from other inputs, everything needs to be rendered again,
+        # but we still need to know what was rendered before to be able to clean it up
+        data = json.loads(path.read_text(encoding="utf-8"))
+        manifest.outputs = data["outputs"]
+        manifest.inputs = data.get("inputs", {})
+        manifest.templates = data.get("templates", {})
+        manifest.page_assets = data.get("page_assets", {})
+        if data["fingerprint"] == fingerprint:
+            manifest.posts = data["posts"]
+            manifest.pages = data["pages"]
+        else:
+            manifest.posts = {k: v | {"source": ""} for k, v in data["posts"].items()}
+            manifest.pages = dict.fromkeys(data["pages"], "")
+        return manifest
+
+    def save(self) -> None:
+        """Write the manifest to disk."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.write_text(
+            json.dumps(
+                {
+                    "fingerprint": self.fingerprint,
+                    "inputs": self.inputs,
+                    "templates": self.templates,
+                    "posts": self.posts,
+                    "outputs": self.outputs,
+                    "pages": self.pages,
+                    "page_assets": self.page_assets,
+                },
+                sort_keys=True,
+            ),
+            encoding="utf-8",
+        )
+
+    @property
+    def fragments_dir(self) -> Path:
+        return self.path.parent / "fragments"
+
+    def stale_reason(self, name: str, source: str) -> str | None:
+        """Get why a post needs to be rendered again, or nothing if it doesn't.
+
+        Whether any post it links to moved is up to the `LinkIndex`.
+        """
+        if (entry := self.posts.get(name)) is None:
+            return "new post"
+        if not entry["source"]:
+            return "what every post is built from changed"
+        if entry["source"] != source:
+            return "source changed"
+
+        # The previous output or rendered content might have been removed out from under us
+        if not (self.fragments_dir / f"{name}.html").exists():
+            return "rendered content is missing"
+        if not (config.get("directories")["output_dir"] / entry["output"]).exists():
+            return "output is missing"
+        return None
+
+    def load_post(self, name: str) -> str:
+        """Get the rendered content of an unchanged post."""
+        return (self.fragments_dir / f"{name}.html").read_text(encoding="utf-8")
+
+    def record_post(self, name: str, /, **entry: Any) -> None:
+        """Record how a post was rendered, keeping its content for later builds."""
+        content = entry.pop("content")
+
+        # If the post now lives at a different URL, get rid of the old one
+        if (previous := self.posts.get(name)) and previous["output"] != entry["output"]:
+            self.remove_output(previous["output"])
+
+        self.fragments_dir.mkdir(parents=True, exist_ok=True)
+        (self.fragments_dir / f"{name}.html").write_text(content, encoding="utf-8")
+        self.posts[name] = entry | {"rendered": content_hash(content)}
+
+    def prune(self, current: set[str]) -> None:
+        """Remove the outputs and rendered content of any post that no longer exists."""
+        # A renamed post can end up with the same output as the post it replaced
+        claimed = {v["output"] for k, v in self.posts.items() if k in current}
+        for name in self.posts.keys() - current:
+            entry = self.posts.pop(name)
+            if entry["output"] not in claimed:
+                self.remove_output(entry["output"])
+
+        # A full build has no record of the posts before it, so the rendered content is
+        # checked against the posts themselves
+        if self.fragments_dir.is_dir():
+            for path in self.fragments_dir.iterdir():
+                if path.name.removesuffix(".html") not in current:
+                    path.unlink()
+
+    def prune_pages(self, current: set[str]) -> None:
+        """Remove any index page or feed that is no longer generated."""
+        for key in self.pages.keys() - current:
+            self.pages.pop(key)
+            self.remove_output(key)
+        for key in self.page_assets.keys() - current:
+            self.page_assets.pop(key)
+
+    def remove_output(self, key: str, /) -> None:
+        """Remove an output file, along with any precompressed version of it."""
+        self.outputs.pop(key, None)
+        path: Path = config.get("directories")["output_dir"] / key
+        path.unlink(missing_ok=True)
+        for fmt in COMPRESSION_FORMATS:
+            path.with_name(f"{path.name}.{fmt}").unlink(missing_ok=True)
+
+    def remove_unwanted_compression(self) -> None:
+        """Remove the precompressed versions of every output in a format no longer asked for."""
+        unwanted = [fmt for fmt in COMPRESSION_FORMATS if fmt not in config.get("precompress")]
+        output_dir: Path = config.get("directories")["output_dir"]
+        for key in self.outputs:
+            for fmt in unwanted:
+                (output_dir / f"{key}.{fmt}").unlink(missing_ok=True)
+
+
+def link_posts(all_posts: dict, /, manifest: Manifest) -> tuple[LinkIndex, set[str]]:
+    """Map each post to its URL, and find every post that links to a post that moved
+    since the last build."""
+    link_index = LinkIndex({
+        post_model.file.name: post_model.meta.url for post_model in all_posts.values()
+    })
+    for name, entry in manifest.posts.items():
+        if name in all_posts:
+            link_index.add(name, entry["links"])
+    moved = link_index.moved({k: v.get("url") for k, v in manifest.posts.items()})
+    return link_index, moved
+
+
+def stale_posts(
+    names: list[str],
+    /,
+    sources: dict[str, str],
+    manifest: Manifest,
+    moved: set[str],
+    images_changed: Callable[[dict[str, str | None]], bool],
+    assets_changed: Callable[[dict[str, str]], bool],
+) -> dict[str, str]:
+    """Work out which posts need to be rendered again, and why.
+
+    `images_changed` tells if any of the images a post used changed since,
+    and `assets_changed` if any of the static files it linked to did.
+    """
+    reasons: dict[str, str] = {}
+    for name in names:
+        if (reason := manifest.stale_reason(name, sources[name])) is None:
+            if name in moved:
+                reason = "a post it links to moved"
+            elif images_changed(manifest.posts[name].get("images", {})):
+                reason = "an image it shows changed"
+            elif assets_changed(manifest.posts[name].get("assets", {})):
+                reason = "a static file it links to changed"
+        if reason is not None:
+            reasons[name] = reason
+    return reasons
+
+
+def write_output(path: Path, data: bytes) -> None:
+    """Write a file to the output directory, skipping it if it hasn't changed."""
+    manifest: Manifest = current_app()["build"]["manifest"]
+    key = path.relative_to(config.get("directories")["output_dir"]).as_posix()
+    digest = content_hash(data)
+
+    # Leave the file (and its modification time) alone when the bytes are identical.
+    # Even without a record of it, the writer won't rewrite a file with the same content
+    if (
+        manifest.outputs.get(key) == digest
+        and path.exists()
+        and all(p.exists() for p in compressed_siblings(path))
+    ):
+        return
+    current_app()["build"]["writer"].write(path, data)
+    manifest.outputs[key] = digest
@@ -0,0 +1,63 @@
+import gzip
+from pathlib import Path
+from time import perf_counter
+
+from src.app import config, current_app
+
+from .profiler import current_profiler
+
+
+__all__ = [
+    "COMPRESSION_FORMATS",
+    "PRECOMPRESSED_SUFFIXES",
+    "compress",
+    "compressed_siblings",
+    "minify",
+]
+
+
+# The formats output files can be precompressed in, used as their extra suffix
+COMPRESSION_FORMATS = ("gz", "br")
+
+# The kinds of files worth precompressing
+PRECOMPRESSED_SUFFIXES = (".html", ".xml", ".json", ".css", ".js", ".svg", ".txt")
+
+
+def minify(content: str, /, name: str = "") -> bytes:
+    """Minify a rendered page, unless it's too small to be worth the time."""
+    data = content.strip().encode()
+    if len(data) < config.get("minify_threshold"):
+        return data
+
+    # Minifying the same page again will give the same result as last time
+    start_time = perf_counter()
+    render_cache = current_app()["build"]["render_cache"]
+    if (minified := render_cache.get("minify", content)) is None:
+        import minify_html
+
+        minified = minify_html.minify(content).strip().encode()
+        render_cache.set("minify", content, minified)
+
+    current_profiler().record_file(
+        name, perf_counter() - start_time, size=len(data), minified_size=len(minified)
+    )
+    return minified
+
+
+def compressed_siblings(path: Path, /) -> list[Path]:
+    """Get the precompressed versions of an output file that should exist."""
+    if path.suffix not in PRECOMPRESSED_SUFFIXES:
+        return []
+    return [path.with_name(f"{path.name}.{fmt}") for fmt in config.get("precompress")]
+
+
+def compress(data: bytes, /, fmt: str) -> bytes:
+    """Compress an output file, the same way every time for the same content."""
+    if fmt == "gz":
+        return gzip.compress(data, compresslevel=9, mtime=0)
+
+    try:
+        import brotli
+    except ImportError as exc:
+        raise RuntimeError("Precompressing with Brotli requires the `brotli` package") from exc
+    return brotli.compress(data, quality=11)
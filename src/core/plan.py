@@ -0,0 +1,268 @@
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+from src.app import config
+
+from . import fingerprint
+from .assets import is_current, load_record, synced_files, wanted_assets
+from .discovery import discover_posts
+from .helpers import content_hash, duration
+from .indexes import (
+    all_index_pages,
+    index_signature,
+    output_to_url,
+    post_signatures,
+    url_to_output,
+)
+from .manifest import (
+    Manifest,
+    build_fingerprint,
+    build_inputs,
+    link_posts,
+    page_templates,
+    stale_posts,
+)
+from .sitemap import sitemap_files
+
+
+__all__ = ["Plan", "make_plan"]
+
+
+# How many of the names given for the same reason are shown in a plan
+SHOWN_NAMES = 5
+
+
+@dataclass(slots=True)
+class Plan:
+    """What building the site would change, and why, without building it.
+
+    Everything is given by name along with the reason it would change.
+    """
+
+    incremental: bool
+    inputs: list[str] = field(default_factory=list)
+    posts: dict[str, str] = field(default_factory=dict)
+    removed_posts: list[str] = field(default_factory=list)
+    pages: dict[str, str] = field(default_factory=dict)
+    removed_pages: list[str] = field(default_factory=list)
+    assets: dict[str, str] = field(default_factory=dict)
+    images: int = 0
+    search: bool = False
+    total_posts: int = 0
+    total_pages: int = 0
+    estimate: float = 0
+    unknown_costs: int = 0
+
+    def print_report(self) -> None:
+        """Display what would change, grouping everything by why."""
+        print("Build plan:")
+        if not self.incremental:
+            print(
+                "\t* Without --incremental, every post and page is rendered again, "
+                "but only the pages listed would change"
+            )
+        if self.inputs:
+            print(
+                "\t* Every post is rendered again, because of changes to: " + ", ".join(self.inputs)
+            )
+
+        estimate = f"about {duration(self.estimate)}"
+        if self.unknown_costs:
+            estimate += f", guessing for {self.unknown_costs} never rendered before"
+        print_group(f"Posts to render ({estimate})", self.posts, total=self.total_posts)
+        print_group("Posts removed", dict.fromkeys(self.removed_posts, "no longer published"))
+        print_group("Pages and feeds to render", self.pages, total=self.total_pages)
+        print_group("Pages and feeds removed", dict.fromkeys(self.removed_pages, "no longer made"))
+        print_group("Assets to sync", self.assets)
+        if self.images:
+            print(f"\t* Images to resize: {self.images}")
+        if self.search:
+            print("\t* Search index: updated for every post rendered or removed")
+
+
+def print_group(title: str, reasons: dict[str, str], /, total: int = 0) -> None:
+    """Display some of the names given for each reason."""
+    print(f"\t* {title}: {len(reasons)}" + (f" of {total}" if total else ""))
+    by_reason: dict[str, list[str]] = {}
+    for name, reason in reasons.items():
+        by_reason.setdefault(reason, []).append(name)
+    for reason, names in sorted(by_reason.items(), key=lambda x: len(x[1]), reverse=True):
+        shown = ", ".join(names[:SHOWN_NAMES])
+        if len(names) > SHOWN_NAMES:
+            shown += f", and {len(names) - SHOWN_NAMES} more"
+        print(f"\t\t- {reason} ({len(names)}): {shown}")
+
+
+def changed_templates(chain: dict[str, str], manifest: Manifest, /) -> list[str]:
+    """Get every template in a chain that changed since the last build."""
+    if not manifest.templates:
+        return []
+    return [k for k, v in chain.items() if manifest.templates.get(k) != v]
+
+
+def make_plan() -> Plan:
+    """Work out what building the site would change, reading nothing but the posts
+    and what the last build recorded.
+
+    Nothing is rendered, and nothing is written, not even the records of what was found.
+    """
+    from src import models
+
+    output_dir: Path = config.get("directories")["output_dir"]
+    plan = Plan(incremental=config.get("incremental"))
+
+    # Work out the URLs templates would link to the static files with
+    asset_urls: dict[str, str] = {}
+    if config.get("fingerprint_assets"):
+        previous = load_record("fingerprints").get("files", {})
+        asset_urls = fingerprint.asset_urls(fingerprint.hash_static_files(previous))
+
+    # Compare what every post is built from with what it was last time
+    inputs = build_inputs()
+    manifest = Manifest.load(
+        config.get("directories")["cache"] / "manifest.json",
+        fingerprint=build_fingerprint(inputs),
+    )
+    if manifest.inputs:
+        plan.inputs = sorted(k for k, v in inputs.items() if manifest.inputs.get(k) != v)
+
+    # Read every post the same way the build would
+    all_posts, sources = models.read_posts(
+        discover_posts(save=False), manifest=manifest, low_memory=True
+    )
+    plan.total_posts = len(all_posts)
+    _, moved = link_posts(all_posts, manifest=manifest)
+    changed: set[str] = set()
+    if config.get("responsive_images"):
+        from .images import changed_images
+
+        changed = changed_images()
+        plan.images = len(changed)
+    plan.posts = stale_posts(
+        list(all_posts),
+        sources=sources,
+        manifest=manifest,
+        moved=moved,
+        images_changed=lambda used: not changed.isdisjoint(used),
+        assets_changed=lambda used: fingerprint.assets_changed(used, asset_urls),
+    )
+    if plan.inputs:
+        reason = "changed: " + ", ".join(plan.inputs)
+        plan.posts = {
+            k: reason if v == "what every post is built from changed" else v
+            for k, v in plan.posts.items()
+        }
+    if not plan.incremental:
+        plan.posts |= {k: "full build" for k in all_posts if k not in plan.posts}
+    plan.removed_posts = sorted(manifest.posts.keys() - all_posts.keys())
+
+    # Estimate how long rendering takes from how long each post took last time
+    costs = [v["cost"] for v in manifest.posts.values() if "cost" in v]
+    average = sum(costs) / len(costs) if costs else 0
+    for name in plan.posts:
+        if "cost" in (entry := manifest.posts.get(name, {})):
+            plan.estimate += entry["cost"]
+        else:
+            plan.estimate += average
+            plan.unknown_costs += 1
+
+    # A page changes when a post it lists is rendered again, or what it's rendered with changed
+    content_hashes = {k: manifest.posts.get(k, {}).get("rendered", "") for k in all_posts}
+    signatures = post_signatures(all_posts.values(), content_hashes=content_hashes)
+    chains = page_templates()
+    page_reasons: dict[str, str] = {}
+    index_keys: list[str] = []
+    for kind, ctx in all_index_pages(list(all_posts.values())):
+        key = url_to_output(ctx["pagination"]["url"]).relative_to(output_dir).as_posix()
+        index_keys.append(key)
+        stale = [p.file.name for p in ctx["posts"] if p.file.name in plan.posts]
+        if key not in manifest.pages:
+            page_reasons[key] = "new page"
+        elif stale:
+            page_reasons[key] = f"lists {stale[0]}, which is rendered again"
+        elif templates := changed_templates(chains[kind], manifest):
+            page_reasons[key] = f"template {templates[0]} changed"
+        elif manifest.pages[key] != index_signature(
+            ctx, templates=chains[kind], signatures=signatures
+        ):
+            page_reasons[key] = "the posts it lists changed"
+        elif not (output_dir / key).exists():
+            page_reasons[key] = "output is missing"
+        elif fingerprint.assets_changed(manifest.page_assets.get(key, {}), asset_urls):
+            page_reasons[key] = "a static file it links to changed"
+
+    # The site pages are rendered every time, but only written when they changed
+    page_keys = set(index_keys)
+    for kind, name in config.get("site")["pages"].items():
+        key = "index.html" if kind == "home_template" else name.replace(".jinja2", ".html")
+        page_keys.add(key)
+        if templates := changed_templates(chains[kind], manifest):
+            page_reasons[key] = f"template {templates[0]} changed"
+        elif "config site" in plan.inputs:
+            page_reasons[key] = "the site config changed"
+        elif not (output_dir / key).exists():
+            page_reasons[key] = "output is missing"
+        elif fingerprint.assets_changed(manifest.page_assets.get(key, {}), asset_urls):
+            page_reasons[key] = "a static file it links to changed"
+
+    # The feeds list the newest posts
+    if config.get("feed"):
+        from .feed import FEED_FILES, feed_settings, feed_signature
+
+        settings = feed_settings()
+        feed_posts = list(all_posts.values())[: settings["items"]]
+        stale = [p.file.name for p in feed_posts if p.file.name in plan.posts]
+        signature = feed_signature(feed_posts, settings=settings, content_hashes=content_hashes)
+        for fmt in settings["formats"]:
+            key = FEED_FILES[fmt]
+            page_keys.add(key)
+            if key not in manifest.pages:
+                page_reasons[key] = "new feed"
+            elif stale:
+                page_reasons[key] = f"lists {stale[0]}, which is rendered again"
+            elif manifest.pages[key] != signature:
+                page_reasons[key] = "the posts it lists or its settings changed"
+            elif not (output_dir / key).exists():
+                page_reasons[key] = "output is missing"
+            elif fingerprint.assets_changed(manifest.page_assets.get(key, {}), asset_urls):
+                page_reasons[key] = "a static file it links to changed"
+
+    # The sitemap is cheap enough to put together, and compare with what was written
+    sitemap_urls: dict[str, Any] = {p.meta.url: p.meta.date for p in all_posts.values()}
+    sitemap_urls |= {output_to_url(k): None for k in index_keys}
+    if "home_template" in config.get("site")["pages"]:
+        sitemap_urls["/"] = None
+    for name, data in sitemap_files(sitemap_urls).items():
+        page_keys.add(name)
+        if manifest.outputs.get(name) != content_hash(data):
+            page_reasons[name] = "the pages it lists changed"
+
+    plan.pages = dict(sorted(page_reasons.items()))
+    plan.total_pages = len(page_keys)
+    plan.removed_pages = sorted(
+        key
+        for key in manifest.pages.keys() - page_keys
+        if not (config.get("search_index") and key.startswith(f"{search_dir()}/"))
+    )
+    plan.search = config.get("search_index") and bool(plan.posts or plan.removed_posts)
+
+    # Assets are copied when they look different than their copies
+    wanted = wanted_assets()
+    for destination, (source, stat) in wanted.items():
+        if not is_current(source, stat, destination):
+            key = destination.relative_to(output_dir).as_posix()
+            plan.assets[key] = "changed" if destination.exists() else "new"
+    for path in synced_files() - wanted.keys():
+        plan.assets[path.relative_to(output_dir).as_posix()] = "removed"
+    for url in asset_urls.values():
+        if not (output_dir / url.lstrip("/")).exists():
+            plan.assets[url.lstrip("/")] = "new fingerprinted copy"
+    plan.assets = dict(sorted(plan.assets.items()))
+    return plan
+
+
+def search_dir() -> str:
+    from .search import search_settings
+
+    return search_settings()["output_dir"]
@@ -0,0 +1,157 @@
+from collections.abc import Iterable, Iterator
+from typing import TYPE_CHECKING, Any
+
+from src.app import config, create_renderers, current_app
+from src.models import Page, Post
+
+from .cache import create_render_cache
+from .helpers import record_assets
+from .links import LinkIndex
+from .profiler import PROFILER, Profiler, current_profiler
+
+
+__all__ = ["minify_page", "minify_pages", "render_post", "render_posts", "worker_context"]
+
+
+if TYPE_CHECKING:
+    from concurrent.futures import ProcessPoolExecutor
+    from multiprocessing.context import BaseContext
+
+
+def worker_context() -> "BaseContext | None":
+    """Get how to start worker processes, or nothing to start them the default way.
+
+    Forking only copies the thread that forked, so a lock held by another thread at the time,
+    like one writing output files or building another site, would never be released in the
+    worker. While there are other threads, workers are forked from a server process instead.
+    """
+    import multiprocessing
+    import threading
+
+    if threading.active_count() > 1 and "forkserver" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("forkserver")
+    return None
+
+
+def create_pool(jobs: int, /) -> "ProcessPoolExecutor":
+    """Create a pool of processes set up like this one."""
+    from concurrent.futures import ProcessPoolExecutor
+
+    return ProcessPoolExecutor(
+        max_workers=jobs,
+        mp_context=worker_context(),
+        initializer=init_worker,
+        initargs=(
+            config.APP_CONFIG.get(),
+            current_app()["build"]["link_index"].urls,
+            current_app()["build"]["image_index"],
+            current_app()["build"]["asset_urls"],
+        ),
+    )
+
+
+def get_pool(jobs: int, /) -> "ProcessPoolExecutor":
+    """Get the pool of processes shared by everything in a build, starting it when first needed.
+
+    It's shut down along with everything else on the build's `exit_stack`.
+    """
+    build = current_app()["build"]
+    if (executor := build.get("pool")) is None:
+        executor = build["pool"] = build["exit_stack"].enter_context(create_pool(jobs))
+    return executor
+
+
+def init_worker(
+    app_config: dict[str, Any],
+    post_url_mapping: dict[str, str],
+    image_index: dict[str, dict[str, Any]],
+    asset_urls: dict[str, str],
+) -> None:
+    """Set up a worker process with its own copy of the config and renderers."""
+    for k, v in app_config.items():
+        config.set(k, v)
+    app = create_renderers()
+    app["build"] = {
+        "link_index": LinkIndex(post_url_mapping),
+        "image_index": image_index,
+        "asset_urls": asset_urls,
+        "render_cache": create_render_cache(),
+    }
+
+
+def render_post(post: Post, /) -> tuple[Post, dict[str, dict[str, str | None]], bytes, Profiler]:
+    """Render a single post to the bytes of its final page.
+
+    The rendered post is returned along with the internal links, images, and static files it used,
+    and how long each stage took, because a post rendered in a worker process is a copy of the original.
+    """
+    profiler = Profiler()
+    token = PROFILER.set(profiler)
+
+    # To keep memory use down, the content may not have been kept around until now
+    if config.get("low_memory"):
+        post.from_file()
+
+    # We provide the raw file name -> url mapping to allow internal blog links to be generated
+    env = {
+        "link_index": current_app()["build"]["link_index"],
+        "internal_links": {},
+    }
+    if config.get("responsive_images"):
+        env |= {"image_index": current_app()["build"]["image_index"], "images": {}}
+    with profiler.stage("markdown"):
+        post.from_markdown(env)
+
+    # All post data is namespaced to make the source of the data clear at all times
+    ctx = {"post": {"meta": post.meta, "content": post.content}}
+    with record_assets() as assets:
+        html = post.to_html(ctx)
+    with profiler.stage("minify"):
+        page = Page.to_bytes(html, name=f"{config.get('post')['output_dir']}/{post.meta.slug}.html")
+
+    PROFILER.reset(token)
+    references = {"links": env["internal_links"], "images": env.get("images", {}), "assets": assets}
+    return post, references, page, profiler
+
+
+def render_posts(
+    posts: Iterable[Post], /, jobs: int
+) -> Iterator[tuple[Post, dict[str, dict[str, str | None]], bytes, Profiler]]:
+    """Render posts, spreading them across `jobs` processes if more than one is requested.
+
+    Posts are always yielded in the order they were given.
+    """
+    if jobs <= 1:
+        yield from map(render_post, posts)
+        return
+
+    # Hand out the posts in batches so the processes aren't kept waiting on each other
+    posts = list(posts)
+    yield from get_pool(jobs).map(render_post, posts, chunksize=max(1, len(posts) // (jobs * 4)))
+
+
+def minify_page(page: tuple[str, str], /) -> tuple[str, bytes, Profiler]:
+    """Minify a single rendered page, identified by its output file name."""
+    profiler = Profiler()
+    token = PROFILER.set(profiler)
+    name, content = page
+    with profiler.stage("minify"):
+        data = Page.to_bytes(content, name=name)
+    PROFILER.reset(token)
+    return name, data, profiler
+
+
+def minify_pages(pages: list[tuple[str, str]], /, jobs: int) -> Iterator[tuple[str, bytes]]:
+    """Minify rendered pages as a batch, spreading them across `jobs` processes if requested.
+
+    Pages are always yielded in the order they were given.
+    """
+    profiler = current_profiler()
+    if jobs <= 1 or len(pages) <= 1:
+        results = map(minify_page, pages)
+    else:
+        results = get_pool(jobs).map(minify_page, pages, chunksize=max(1, len(pages) // (jobs * 4)))
+
+    for name, data, page_profiler in results:
+        profiler.merge(page_profiler)
+        yield name, data
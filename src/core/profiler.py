@@ -0,0 +1,119 @@
+import json
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from pathlib import Path
+from time import perf_counter
+from typing import Any
+
+
+__all__ = ["Profiler", "current_profiler"]
+
+
+@dataclass(slots=True)
+class Profiler:
+    """Time how long each stage of a build takes, in total and for each post.
+
+    Stages can be timed inside of other stages, so the `total` only counts the outermost ones.
+    """
+
+    stages: dict[str, float] = field(default_factory=dict)
+    posts: dict[str, dict[str, float]] = field(default_factory=dict)
+    files: dict[str, dict[str, float]] = field(default_factory=dict)
+    current_post: str = ""
+    total: float = 0
+    depth: int = 0
+
+    @contextmanager
+    def stage(self, name: str, /) -> Iterator[None]:
+        """Time a stage, attributing it to the current post if there is one."""
+        start_time = perf_counter()
+        self.depth += 1
+        try:
+            yield
+        finally:
+            elapsed = perf_counter() - start_time
+            self.depth -= 1
+            if not self.depth:
+                self.total += elapsed
+            self.stages[name] = self.stages.get(name, 0) + elapsed
+            if self.current_post:
+                timings = self.posts.setdefault(self.current_post, {})
+                timings[name] = timings.get(name, 0) + elapsed
+
+    @contextmanager
+    def post(self, name: str, /) -> Iterator[None]:
+        """Attribute every stage timed inside this block to a post."""
+        self.current_post = name
+        try:
+            yield
+        finally:
+            self.current_post = ""
+
+    def record_file(self, name: str, elapsed: float, /, size: int, minified_size: int) -> None:
+        """Record how long minifying a file took."""
+        self.files[name] = {"minify": elapsed, "size": size, "minified_size": minified_size}
+
+    def merge(self, other: "Profiler", /, post: str = "") -> None:
+        """Add the timings that were recorded elsewhere, optionally attributing them to a post."""
+        self.files.update(other.files)
+        if not self.depth:
+            self.total += other.total
+        post_timings = self.posts.setdefault(post, {}) if post else {}
+        for stage, elapsed in other.stages.items():
+            self.stages[stage] = self.stages.get(stage, 0) + elapsed
+            post_timings[stage] = post_timings.get(stage, 0) + elapsed
+
+    def report(self, /, slowest: int = 10) -> dict[str, Any]:
+        """Summarize the timings, including the slowest posts."""
+        post_totals = {k: sum(v.values()) for k, v in self.posts.items()}
+        return {
+            "stages": self.stages,
+            "total": self.total,
+            "slowest_posts": [
+                {"post": k, "total": v, "stages": self.posts[k]}
+                for k, v in sorted(post_totals.items(), key=lambda x: x[1], reverse=True)[:slowest]
+            ],
+            "posts": self.posts,
+            "slowest_minified_files": [
+                {"file": k} | v
+                for k, v in sorted(self.files.items(), key=lambda x: x[1]["minify"], reverse=True)[
+                    :slowest
+                ]
+            ],
+            "files": self.files,
+        }
+
+    def print_report(self, /, slowest: int = 10) -> None:
+        """Display a readable breakdown of the timings."""
+        report = self.report(slowest)
+        print("Time spent in each stage:")
+        for stage, elapsed in sorted(report["stages"].items(), key=lambda x: x[1], reverse=True):
+            print(f"\t* {stage}: {elapsed * 1000:,.1f}ms")
+        print(f"The {len(report['slowest_posts'])} slowest posts:")
+        for post in report["slowest_posts"]:
+            breakdown = ", ".join(f"{k}={v * 1000:,.1f}ms" for k, v in post["stages"].items())
+            print(f"\t* {post['post']}: {post['total'] * 1000:,.1f}ms ({breakdown})")
+        if report["slowest_minified_files"]:
+            print(f"The {len(report['slowest_minified_files'])} slowest files to minify:")
+            for file in report["slowest_minified_files"]:
+                print(
+                    f"\t* {file['file']}: {file['minify'] * 1000:,.1f}ms "
+                    f"({file['size']:,} -> {file['minified_size']:,} bytes)"
+                )
+
+    def save(self, path: Path, /, slowest: int = 10) -> None:
+        """Save the timings as JSON."""
+        path.write_text(json.dumps(self.report(slowest), indent=2), encoding="utf-8")
+
+
+PROFILER: ContextVar[Profiler | None] = ContextVar("profiler", default=None)
+
+
+def current_profiler() -> Profiler:
+    """Get the profiler of the current context, starting one if it doesn't have any yet."""
+    if (profiler := PROFILER.get()) is None:
+        profiler = Profiler()
+        PROFILER.set(profiler)
+    return profiler
@@ -0,0 +1,154 @@
+import html
+import json
+import re
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+from src.app import config, current_app
+
+from .helpers import content_hash
+from .manifest import Manifest, write_output
+
+
+__all__ = ["SearchIndex", "search_settings", "tokenize"]
+
+
+# Everything between angle brackets is markup, not words
+RE_TAGS = re.compile(r"<[^>]*>")
+RE_WORDS = re.compile(r"\w+")
+
+
+def search_settings() -> dict[str, Any]:
+    """Get the search index config, filling in the defaults."""
+    return {"output_dir": "search", "prefix_length": 2, "min_length": 2} | config.get("search")
+
+
+def tokenize(*texts: str, min_length: int) -> list[str]:
+    """Get the distinct words of some HTML, in lowercase."""
+    words = set()
+    for text in texts:
+        words.update(RE_WORDS.findall(html.unescape(RE_TAGS.sub(" ", text)).casefold()))
+    return sorted(w for w in words if len(w) >= min_length)
+
+
+@dataclass(slots=True)
+class SearchIndex:
+    """Keep the words of every post, to be saved as an inverted index split into shards.
+
+    The words are kept between builds so that only the posts that changed
+    need to be read again, and only the shards they touch need to be saved again.
+    """
+
+    path: Path
+    settings: dict[str, Any]
+    ids: dict[str, int] = field(default_factory=dict)
+    posts: dict[str, dict[str, Any]] = field(default_factory=dict)
+    next_id: int = 0
+    changed: set[str] = field(default_factory=set)
+
+    @classmethod
+    def load(cls, path: Path, /, settings: dict[str, Any]) -> "SearchIndex":
+        """Load the words of every post from the last build."""
+        index = cls(path, settings=settings)
+        if not path.exists():
+            return index
+
+        # Posts keep their IDs for as long as they exist, but
+        # the words have to be found again if they're split up differently
+        data = json.loads(path.read_text(encoding="utf-8"))
+        index.ids = data["ids"]
+        index.next_id = max(index.ids.values(), default=-1) + 1
+        if data["settings"] == settings:
+            index.posts = data["posts"]
+        return index
+
+    def save(self) -> None:
+        """Write the words of every post to disk."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.write_text(
+            json.dumps({"settings": self.settings, "ids": self.ids, "posts": self.posts}),
+            encoding="utf-8",
+        )
+
+    def shard(self, word: str, /) -> str:
+        return word[: self.settings["prefix_length"]]
+
+    def update(self, name: str, post, /, rendered: str) -> None:
+        """Find the words of a post again, if anything about it changed."""
+        doc = {
+            "title": post.meta.title,
+            "url": post.meta.url,
+            "date": post.meta.date.isoformat(),
+            "tags": post.meta.tags,
+        }
+        signature = content_hash(json.dumps([doc, rendered]))
+        if (previous := self.posts.get(name)) and previous["signature"] == signature:
+            return
+
+        # Content that was dropped to keep memory use down is still on disk
+        manifest: Manifest = current_app()["build"]["manifest"]
+        content = post.content or manifest.load_post(name)
+        words = tokenize(
+            doc["title"], " ".join(doc["tags"]), content, min_length=self.settings["min_length"]
+        )
+
+        # Only the shards of the words that came or went need to be saved again
+        before = set(previous["words"]) if previous else set()
+        self.changed.update(self.shard(w) for w in before.symmetric_difference(words))
+        if name not in self.ids:
+            self.ids[name] = self.next_id
+            self.next_id += 1
+        self.posts[name] = {"signature": signature, "doc": doc, "words": words}
+
+    def prune(self, current: set[str]) -> None:
+        """Forget every post that no longer exists."""
+        for name in self.posts.keys() - current:
+            self.changed.update(self.shard(w) for w in self.posts.pop(name)["words"])
+        for name in self.ids.keys() - current:
+            self.ids.pop(name)
+
+    def save_outputs(self, /, everything: bool = False) -> set[str]:
+        """Save the posts and the shards that changed, returning the output file names of all of them.
+
+        Each shard maps the words starting with the same letters to the IDs of the posts they're in.
+        """
+        output_dir: Path = config.get("directories")["output_dir"]
+        search_dir = output_dir / self.settings["output_dir"]
+        (search_dir / "shards").mkdir(parents=True, exist_ok=True)
+
+        manifest: Manifest = current_app()["build"]["manifest"]
+        outputs = set()
+
+        def save(path: Path, data: Any) -> None:
+            key = path.relative_to(output_dir).as_posix()
+            outputs.add(key)
+            data = json.dumps(data, separators=(",", ":")).encode()
+            write_output(path, data)
+            manifest.pages[key] = content_hash(data)
+
+        # Describe every post once, so each shard only needs to list IDs
+        save(
+            search_dir / "index.json",
+            {
+                "prefix_length": self.settings["prefix_length"],
+                "min_length": self.settings["min_length"],
+                "posts": {self.ids[k]: v["doc"] for k, v in self.posts.items()},
+            },
+        )
+
+        # Put together every shard that changed, or that's missing
+        shards: dict[str, dict[str, list[int]]] = {}
+        for name, entry in self.posts.items():
+            for word in entry["words"]:
+                shards.setdefault(self.shard(word), {}).setdefault(word, []).append(self.ids[name])
+
+        for prefix, words in shards.items():
+            path = search_dir / "shards" / f"{prefix}.json"
+            if not everything and prefix not in self.changed and path.exists():
+                outputs.add(path.relative_to(output_dir).as_posix())
+                continue
+            save(path, {k: sorted(v) for k, v in sorted(words.items())})
+
+        self.changed.clear()
+        return outputs
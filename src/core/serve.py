@@ -0,0 +1,123 @@
+import os
+import traceback
+from collections.abc import Callable
+from contextlib import suppress
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from threading import Thread
+from time import perf_counter, sleep
+
+from src.app import config
+
+from .assets import asset_destinations, copy_file
+
+
+__all__ = ["serve", "watch"]
+
+
+WATCHED_DIRECTORIES = ("posts", "theme", "static", "media", "root")
+
+
+class OutputRequestHandler(SimpleHTTPRequestHandler):
+    """Serve the output directory, resolving post URLs to their HTML file."""
+
+    def translate_path(self, path: str) -> str:
+        # Posts are linked to without their file extension
+        translated = super().translate_path(path)
+        if not Path(translated).exists() and Path(f"{translated}.html").is_file():
+            return f"{translated}.html"
+        return translated
+
+
+def snapshot(directory: Path, /) -> dict[Path, tuple[int, int]]:
+    """Record the modification time and size of every file in a directory tree."""
+    files: dict[Path, tuple[int, int]] = {}
+    pending = [directory] if directory.is_dir() else []
+    while pending:
+        with os.scandir(pending.pop()) as it:
+            for entry in it:
+                if entry.is_dir():
+                    pending.append(Path(entry.path))
+                    continue
+                stat = entry.stat()
+                files[Path(entry.path)] = (stat.st_mtime_ns, stat.st_size)
+    return files
+
+
+def watch(rebuild: Callable[[], None], /, interval: float = 0.25) -> None:
+    """Watch the site files, updating the output directory as they change."""
+    all_directories: dict[str, Path] = config.get("directories")
+    watched = {k: all_directories[k].resolve() for k in WATCHED_DIRECTORIES}
+    ignored = (all_directories["output_dir"].resolve(), all_directories["cache"].resolve())
+    destinations = asset_destinations()
+
+    def owner(path: Path) -> str:
+        # The static and root directories usually live inside the theme,
+        # so a file belongs to the most specific directory it is in
+        return max(
+            (k for k, v in watched.items() if path.is_relative_to(v)),
+            key=lambda k: len(watched[k].parts),
+        )
+
+    def take_snapshot() -> dict[Path, tuple[int, int]]:
+        files: dict[Path, tuple[int, int]] = {}
+        for directory in watched.values():
+            files.update(snapshot(directory))
+        return {k: v for k, v in files.items() if not any(k.is_relative_to(d) for d in ignored)}
+
+    previous = take_snapshot()
+    while True:
+        sleep(interval)
+        current = take_snapshot()
+        if current == previous:
+            continue
+
+        start_time = perf_counter()
+        changed = {p for p in previous.keys() | current.keys() if previous.get(p) != current.get(p)}
+        previous = current
+        kinds = {owner(p) for p in changed}
+
+        # Asset files only need to be copied over (or removed)
+        for path in changed:
+            if (kind := owner(path)) not in destinations:
+                continue
+            destination = destinations[kind] / path.relative_to(watched[kind])
+            if path in current:
+                copy_file(path, destination)
+            else:
+                destination.unlink(missing_ok=True)
+
+        # Posts and templates need the site to be rendered again, and so do static files
+        # whose URLs have their content hash in them, and images that are resized.
+        # A broken post or template shouldn't bring down the server, so report it and move on
+        rendered = {"posts", "theme"}
+        if config.get("fingerprint_assets"):
+            rendered.add("static")
+        if config.get("responsive_images"):
+            rendered.add("media")
+        if kinds & rendered:
+            try:
+                rebuild()
+            except Exception:  # noqa: BLE001
+                traceback.print_exc()
+                continue
+        elapsed = (perf_counter() - start_time) * 1000
+        print(f"Rebuilt {', '.join(sorted(kinds))} in {elapsed:.0f}ms")
+
+
+def serve(rebuild: Callable[[], None], /) -> None:
+    """Serve the output directory locally, rebuilding the site whenever its files change."""
+    # Everything after the first build only needs to deal with what changed
+    config.set("incremental", True)
+
+    server = ThreadingHTTPServer(
+        ("127.0.0.1", config.get("port")),
+        partial(OutputRequestHandler, directory=str(config.get("directories")["output_dir"])),
+    )
+    Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Serving the site at http://127.0.0.1:{config.get('port')}, press Ctrl+C to stop")
+
+    with suppress(KeyboardInterrupt):
+        watch(rebuild)
+    server.shutdown()
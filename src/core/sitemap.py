@@ -0,0 +1,64 @@
+from datetime import date
+from html import escape
+from pathlib import Path
+
+from src.app import config
+
+from .manifest import write_output
+
+
+__all__ = ["MAX_URLS", "save_sitemap", "sitemap_files"]
+
+
+# The most URLs a single sitemap can list
+MAX_URLS = 50_000
+
+XML_DECLARATION = "<?xml version='1.0' encoding='UTF-8'?>\n"
+XMLNS = 'xmlns="http://www.sitemaps.org/schemas/sitemap/0.9"'
+
+
+def save_sitemap(urls: dict[str, date | None], /) -> set[str]:
+    """Save a sitemap of every page URL, along with when it last changed.
+
+    The output file names are returned.
+    """
+    output_dir: Path = config.get("directories")["output_dir"]
+    files = sitemap_files(urls)
+    for name, data in files.items():
+        write_output(output_dir / name, data)
+    return set(files)
+
+
+def sitemap_files(urls: dict[str, date | None], /) -> dict[str, bytes]:
+    """Put together a sitemap of every page URL, by its output file name.
+
+    Past `MAX_URLS`, the URLs are split across several sitemaps, and
+    `sitemap.xml` becomes an index of them.
+    """
+    # Escaping like HTML without quotes is the same as escaping XML text,
+    # without importing `xml.sax` (and the whole of `urllib.request` along with it)
+    domain = escape(config.get("site")["domain"], quote=False)
+    entries = [
+        f"<url><loc>{domain}{escape(url, quote=False)}</loc>"
+        + (f"<lastmod>{lastmod.isoformat()}</lastmod>" if lastmod else "")
+        + "</url>"
+        for url, lastmod in sorted(urls.items())
+    ]
+
+    # Everything fits in a single sitemap
+    chunks = [entries[i : i + MAX_URLS] for i in range(0, len(entries), MAX_URLS)] or [[]]
+    if len(chunks) == 1:
+        return {"sitemap.xml": render_sitemap(entries)}
+
+    names = [f"sitemap-{n}.xml" for n in range(1, len(chunks) + 1)]
+    files = {name: render_sitemap(chunk) for name, chunk in zip(names, chunks, strict=True)}
+    files["sitemap.xml"] = (
+        f"{XML_DECLARATION}<sitemapindex {XMLNS}>"
+        + "".join(f"<sitemap><loc>{domain}/{name}</loc></sitemap>" for name in names)
+        + "</sitemapindex>"
+    ).encode()
+    return files
+
+
+def render_sitemap(entries: list[str], /) -> bytes:
+    return f"{XML_DECLARATION}<urlset {XMLNS}>{''.join(entries)}</urlset>".encode()
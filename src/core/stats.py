@@ -0,0 +1,89 @@
+import re
+import string
+
+from .helpers import RE_CODE_SPAN, split_code_blocks
+
+
+__all__ = ["FIELDS", "VERSION", "WORDS_PER_MINUTE", "read_stats"]
+
+
+# Bump this whenever the stats are worked out differently, so the cached ones are replaced
+VERSION = 5
+
+# The stats of a post, in the order they're given
+FIELDS = ("words", "minutes", "images", "links")
+
+# How fast posts are expected to be read
+WORDS_PER_MINUTE = 200
+
+# The parts of Markdown that aren't read as words, or that are counted separately
+RE_IMAGE = re.compile(r"!\[[^\]]*\]\([^)]*\)")
+RE_LINK = re.compile(r"\[([^\]]*)\]\([^)]*\)")
+RE_REFERENCE = re.compile(
+    r"^ {0,3}\[([^\]]+)\]:[ \t]*\n?[ \t]*\S+"
+    r"(?:[ \t]*\n?[ \t]*(?:\"[^\"\n]*\"|'[^'\n]*'|\([^)\n]*\)))?[ \t]*$",
+    re.MULTILINE,
+)
+RE_REFERENCE_IMAGE = re.compile(r"!\[([^\]]*)\](?:\[([^\]]*)\])?")
+RE_REFERENCE_LINK = re.compile(r"\[([^\]]*)\](?:\[([^\]]*)\])?")
+RE_AUTOLINK = re.compile(r"<[a-zA-Z][a-zA-Z0-9+.-]{1,31}:[^<>\s]*>")
+RE_TAG = re.compile(r"</?[a-zA-Z][^<>]*>")
+
+
+def count_words(text: str, /) -> int:
+    """Count the words in some text, ignoring anything that's only punctuation."""
+    return sum(word.strip(string.punctuation).isalpha() for word in text.split())
+
+
+def reference_label(label: str, /) -> str:
+    """Normalise the label of a link reference, which is matched regardless of case and spacing."""
+    return " ".join(label.split()).casefold()
+
+
+def read_stats(content: str, /) -> dict[str, int]:
+    """Work out the reading stats of a post from its Markdown, without rendering it.
+
+    Words are counted the same way rendering counts them, in the text that's read:
+    leaving out code, images, HTML, link reference definitions, and the targets of links.
+    """
+    # Links can refer to a definition anywhere in the post, outside of code
+    prose_parts = []
+    labels: set[str] = set()
+    for prose, _ in split_code_blocks(content):
+        prose = RE_CODE_SPAN.sub(" ", prose)
+        if "]:" in prose:
+            labels.update(reference_label(m[1]) for m in RE_REFERENCE.finditer(prose))
+            prose = RE_REFERENCE.sub(" ", prose)
+        prose_parts.append(prose)
+
+    # A reference is only a link or image when what it refers to is defined,
+    # otherwise it's read as it is
+    def reference(match: re.Match, /) -> str:
+        nonlocal images, links
+        if reference_label(match[2] or match[1]) not in labels:
+            return match[0]
+        if match[0].startswith("!"):
+            images += 1
+            return " "
+        links += 1
+        return f" {match[1]} "
+
+    words = images = links = 0
+    for prose in prose_parts:
+        prose, count = RE_IMAGE.subn(" ", prose)
+        images += count
+        prose, count = RE_LINK.subn(r" \1 ", prose)
+        links += count
+        if labels:
+            prose = RE_REFERENCE_IMAGE.sub(reference, prose)
+            prose = RE_REFERENCE_LINK.sub(reference, prose)
+        prose, count = RE_AUTOLINK.subn(" ", prose)
+        links += count
+        words += count_words(RE_TAG.sub(" ", prose))
+
+    return {
+        "words": words,
+        "minutes": round(words / WORDS_PER_MINUTE),
+        "images": images,
+        "links": links,
+    }
@@ -0,0 +1,84 @@
+import contextvars
+import os
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from .minify import compress, compressed_siblings
+
+
+__all__ = ["OutputWriter", "write_atomic", "write_if_changed"]
+
+
+def write_atomic(path: Path, data: bytes) -> None:
+    """Write a file so that it is never seen partially written."""
+    temp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    temp_path.write_bytes(data)
+    temp_path.replace(path)
+
+
+def write_if_changed(path: Path, data: bytes) -> bool:
+    """Write a file, unless it already has the exact same content."""
+    # Leaving an unchanged file alone keeps its modification time stable
+    try:
+        if path.stat().st_size == len(data) and path.read_bytes() == data:
+            return False
+    except FileNotFoundError:
+        pass
+
+    write_atomic(path, data)
+    return True
+
+
+@dataclass(slots=True)
+class OutputWriter:
+    """Write output files, optionally in the background on a pool of threads.
+
+    With no threads, every file is written immediately. Otherwise, writes are
+    queued up, and `close()` must be called to make sure they all finished.
+    Any precompressed versions of a file are written along with it.
+    """
+
+    threads: int = 0
+    max_pending: int = 256
+    executor: ThreadPoolExecutor | None = None
+    pending: deque[Future] = field(default_factory=deque)
+
+    def write(self, path: Path, data: bytes) -> None:
+        """Write a file, or queue it up to be written."""
+        if self.threads <= 0:
+            self.write_file(path, data)
+            return
+
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.threads)
+
+        # Don't let too many files pile up in memory waiting to be written.
+        # Each write is done with the config of the site it's for
+        while len(self.pending) >= self.max_pending:
+            self.pending.popleft().result()
+        self.pending.append(
+            self.executor.submit(contextvars.copy_context().run, self.write_file, path, data)
+        )
+
+    @staticmethod
+    def write_file(path: Path, data: bytes) -> None:
+        """Write a file and its precompressed versions."""
+        changed = write_if_changed(path, data)
+        for sibling in compressed_siblings(path):
+            if changed or not sibling.exists():
+                write_atomic(sibling, compress(data, fmt=sibling.suffix[1:]))
+
+    def flush(self) -> None:
+        """Wait for every queued write to finish, raising the first error any of them had."""
+        while self.pending:
+            self.pending.popleft().result()
+
+    def close(self) -> None:
+        """Finish all writes and stop the threads."""
+        self.flush()
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
@@ -1,17 +1,33 @@
-import re
+import json
+import sys
 import tomllib
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, fields
+from datetime import date, datetime
 from pathlib import Path
-from typing import Any
-from urllib.parse import quote_plus
+from typing import TYPE_CHECKING, Any
 
-import minify_html
+from .app import config, current_app, get_renderer
+from .core import stats
+from .core.helpers import content_hash, normalise_text, read_front_matter, slugify
+from .core.images import images_changed
+from .core.manifest import Manifest, write_output
+from .core.minify import minify
+from .core.profiler import current_profiler
 
-from .app import config, current_app
-from .core.helpers import remove_falsey_items, replace_curly_quotes
 
+__all__ = ["Post", "PostIndex", "PostMeta", "TagIndex", "read_posts"]
 
-__all__ = ["Post", "PostIndex"]
+
+if TYPE_CHECKING:
+    from jinja2 import Template
+
+
+def get_template(name: str, /) -> "Template":
+    """Get a template, looking it up only once for each build."""
+    templates: dict[str, Template] = current_app()["build"].setdefault("templates", {})
+    if (template := templates.get(name)) is None:
+        template = templates[name] = get_renderer("jinja").get_template(name)
+    return template
 
 
 @dataclass(slots=True)
@@ -20,7 +36,6 @@ class Page:
     content: str = ""
     raw_meta: str = ""
     template_key: str = ""
-    meta: dict[str, Any] = field(default_factory=dict)
 
     def __post_init__(self) -> None:
         # Make the model file point to the actual template name
@@ -34,121 +49,237 @@ class Page:
 
     def from_file(self) -> None:
         """Read a page's content into memory."""
-        self.content = replace_curly_quotes(self.file.read_text(encoding="utf-8")).strip()
+        self.content = normalise_text(self.file.read_text(encoding="utf-8").strip())
 
     def to_html(self, /, ctx: dict[str, Any] | None = None) -> str:
         """Render a page's content to a complete HTML page."""
         if ctx is None:
             ctx = {}
-        return current_app()["render"]["jinja"].get_template(self.template_name).render(ctx).strip()
+        with current_profiler().stage("jinja"):
+            return get_template(self.template_name).render(ctx).strip()
+
+    @staticmethod
+    def to_bytes(content: str, /, name: str = "") -> bytes:
+        """Prepare a rendered page for writing, optionally minifying it."""
+        if not config.get("minify"):
+            return content.strip().encode()
+        return minify(content, name=name)
 
     @staticmethod
     def to_file(path: Path, content: str) -> None:
         """Write a page to disk, optionally minifying it."""
-        content = minify_html.minify(content) if config.get("minify") else content
-        path.write_bytes(content.strip().encode())
+        profiler = current_profiler()
+        with profiler.stage("minify"):
+            data = Page.to_bytes(
+                content, name=path.relative_to(config.get("directories")["output_dir"]).as_posix()
+            )
+        with profiler.stage("write"):
+            write_output(path, data)
 
 
+@dataclass(slots=True)
+class PostMeta:
+    """The metadata of a post, checked and filled in with the defaults once when it's read.
+
+    Anything else in the front matter is kept in `extra`. Like with a dict, every
+    field can be looked up by its key, and so can anything in `extra` by its name.
+    """
+
+    title: str
+    date: date
+    slug: str
+    url: str
+    subtitle: str = ""
+    author: str = ""
+    tags: tuple[str, ...] = ()
+    image: str = ""
+    caption: str = ""
+    stats: dict[str, int] = field(default_factory=dict)
+    extra: dict[str, Any] = field(default_factory=dict)
+
+    @classmethod
+    def parse(cls, raw_meta: str, /, name: str) -> "PostMeta":
+        """Read the metadata of a post from its front matter, raising an error if it's invalid."""
+        # Make sure there is meta info to use
+        if not raw_meta:
+            raise RuntimeError(f"Post {name} is missing meta")
+        try:
+            data = tomllib.loads(raw_meta)
+        except tomllib.TOMLDecodeError as e:
+            raise RuntimeError(f"Post {name} has invalid meta: {e}") from e
+
+        post_config = config.get("post")
+        defaults: dict[str, Any] = post_config["defaults"]
+        title = expect(data.pop("title", None), str, name=name, key="title")
+        slug = slugify(title)
+
+        # If there's no post author but a default author, use it instead
+        subtitle = expect(
+            data.pop("subtitle", defaults["subtitle"]), str, name=name, key="subtitle"
+        )
+        author = expect(data.pop("author", ""), str, name=name, key="author") or defaults.get(
+            "author", ""
+        )
+
+        # Place the default tags before or after the post's own, as requested.
+        # Each tag is prefixed with a hashtag to better indicate its purpose
+        tags = parse_tags(data.pop("tags", []), name=name, key="tags")
+        default_tags = parse_tags(defaults.get("tags", []), name=name, key="default tags")
+        tags = default_tags + tags if defaults.get("tags_before", True) else tags + default_tags
+
+        # Generate the caption for the featured image for the post if the both exist
+        image = expect(data.pop("image", ""), str, name=name, key="image")
+        caption = expect(data.pop("caption", ""), str, name=name, key="caption")
+        if image and caption:
+            caption = get_renderer("markdown").render(caption)
+
+        return cls(
+            title=title,
+            date=parse_date(data.pop("date", None), name=name),
+            slug=slug,
+            url=f"/{post_config['output_dir']}/{slug}",
+            subtitle=subtitle,
+            author=author,
+            tags=tuple(sys.intern(f"#{tag}") for tag in tags),
+            image=image,
+            caption=caption,
+            extra=data,
+        )
+
+    @property
+    def wordcount(self) -> dict[str, int]:
+        """Get how many words the post has and how many minutes it takes to read."""
+        return {"words": self.stats["words"], "minutes": self.stats["minutes"]}
+
+    def __getattr__(self, name: str) -> Any:
+        # Only what isn't a field ends up here
+        if name != "extra" and not name.startswith("_") and name in self.extra:
+            return self.extra[name]
+        raise AttributeError(name)
+
+    def __getitem__(self, key: str) -> Any:
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __contains__(self, key: str) -> bool:
+        return key in POST_META_FIELDS or key in self.extra
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return getattr(self, key, default)
+
+    def to_dict(self) -> dict[str, Any]:
+        """Get the metadata as plain JSON-ready values, with anything else in the front matter."""
+        return {
+            "title": self.title,
+            "date": self.date.isoformat(),
+            "slug": self.slug,
+            "url": self.url,
+            "subtitle": self.subtitle,
+            "author": self.author,
+            "tags": list(self.tags),
+            "image": self.image,
+            "caption": self.caption,
+            "stats": self.stats,
+        } | self.extra
+
+
+POST_META_FIELDS = frozenset(f.name for f in fields(PostMeta)) - {"extra"} | {"wordcount"}
+
+
+def expect(value: Any, kind: type, /, name: str, key: str) -> Any:
+    """Make sure a value from the front matter of a post is of the right type."""
+    if isinstance(value, kind):
+        return value
+    if value is None:
+        raise RuntimeError(f"Post {name} is missing a {key}")
+    raise RuntimeError(f"Post {name} has a {key} that isn't a {kind.__name__}: {value!r}")
+
+
+def parse_tags(value: Any, /, name: str, key: str) -> list[str]:
+    """Get the tags from a single tag or a list of them, leaving out the empty ones."""
+    if isinstance(value, str):
+        value = [value]
+    if isinstance(value, list) and all(isinstance(tag, str) for tag in value):
+        return [tag for tag in value if tag]
+    raise RuntimeError(f"Post {name} has {key} that aren't a string or list of strings")
+
+
+def parse_date(value: Any, /, name: str) -> date:
+    """Get the date of a post, which can also be written with a time or as a string."""
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            raise RuntimeError(f"Post {name} has a date that isn't valid: {value!r}") from None
+    if isinstance(value, datetime):
+        return value.date()
+    return expect(value, date, name=name, key="date")
+
+
+@dataclass(slots=True)
 class Post(Page):
     """Represent an individual post."""
 
-    parsed_content = None
+    meta: PostMeta = field(init=False)
 
     def __post_init__(self) -> None:
-        # Extract the meta content from the page content,
-        # then remove it because we don't want it in the content
-        super().__post_init__()
-        self.parse_content()
+        # The meta content is read separately from the page content
+        # because we don't want it in the content. A slotted class is recreated
+        # by `dataclass`, which leaves it unable to use `super()` without arguments
+        Page.__post_init__(self)
         self.parse_meta()
-        self.generate_slug()
-        self.generate_url()
-        self.content = self.content.replace(self.raw_meta, "").strip()
 
     @property
     def template_name(self) -> str:
         return config.get("post")["post_template"]
 
+    def from_file(self) -> None:
+        """Read a post's meta and content into memory."""
+        # Only the front matter is looked at to get the meta. The content is read straight after
+        with self.file.open(encoding="utf-8") as f:
+            self.raw_meta = normalise_text(read_front_matter(f))
+            self.content = normalise_text(f.read().strip(), skip_code=True)
+
     def from_markdown(self, /, ctx: dict[str, Any]) -> None:
         """Convert the page content from Markdown to HTML."""
-        # `ctx` is provided to add the `wordcount` info to the post meta
-        self.content = current_app()["render"]["markdown"].render(self.content, ctx)
-
-    def generate_slug(self) -> None:
-        """Generate a slug for this post."""
-        self.meta["slug"] = quote_plus(
-            "-".join(
-                m.lower()
-                for m in re.findall(r"\w+", self.meta["title"].replace("'", ""), flags=re.I)
-            )
+        # `ctx` is provided to collect the internal links and images the post used
+        ctx.setdefault("internal_links", {})
+        ctx.setdefault("images", {})
+
+        # If this content was rendered before, reuse it as long as every internal link
+        # it made would still point to the same place, and every image is resized the same
+        render_cache = current_app()["build"]["render_cache"]
+        if (cached := render_cache.get("markdown", self.content)) is not None:
+            entry = json.loads(cached)
+            link_index = current_app()["build"]["link_index"]
+            if all(link_index.url(k) == v for k, v in entry["links"].items()) and not (
+                "image_index" in ctx and images_changed(entry["images"], ctx["image_index"])
+            ):
+                ctx["internal_links"].update(entry["links"])
+                ctx["images"].update(entry["images"])
+                self.content = entry["html"]
+                return
+
+        # This is the only time the content is parsed, and those tokens are rendered as-is
+        markdown = get_renderer("markdown")
+        tokens = markdown.parse(self.content, ctx)
+        html = markdown.renderer.render(tokens, markdown.options, ctx)
+        render_cache.set(
+            "markdown",
+            self.content,
+            json.dumps({
+                "html": html,
+                "links": ctx["internal_links"],
+                "images": ctx["images"],
+            }).encode(),
         )
-
-    def generate_url(self) -> None:
-        """Generate a URL for this post."""
-        self.meta["url"] = "/{}/{}".format(str(config.get("post")["output_dir"]), self.meta["slug"])
-
-    def parse_content(self) -> None:
-        # Parse the content of the markdown file and store the AST for later
-        # for further transformations
-        self.parsed_content = current_app()["render"]["markdown"].parse(self.content)
+        self.content = html
 
     def parse_meta(self) -> None:
         """Extract a post's metadata from the file."""
-
-        # Attempt to find the meta info
-        if not (front_matter := [e for e in self.parsed_content if e.type == "front_matter"]):
-            raise RuntimeError(f"Post {self.file.name} is missing meta")
-
-        # Convert some data into native objects/and fill in default values to make things nicer
-        page_meta = tomllib.loads(front_matter[0].content)
-        page_meta["subtitle"] = page_meta.get(
-            "subtitle", config.get("post")["defaults"]["subtitle"]
-        )
-
-        # If there is an author for the post, use it. Even if not, set the key
-        page_meta["author"] = page_meta.get("author", "")
-
-        # If there's no post author but a default author, use it instead
-        default_author: str = config.get("post")["defaults"].get("author", "")
-        if not page_meta["author"] and default_author:
-            page_meta["author"] = default_author
-
-        # If there are no tags for the post, set the key. If there are default tags, use them
-        page_meta["tags"] = page_meta.get("tags", [])
-
-        # If there are tags, and it's a single string value, wrap it in a list
-        # for a consistent render context variable
-        if isinstance(page_meta["tags"], str):
-            page_meta["tags"] = [page_meta["tags"]]
-        page_meta["tags"] = remove_falsey_items(page_meta["tags"])
-
-        # Pull out any default post tags
-        default_tags: str | list[str] = config.get("post")["defaults"].get("tags", [])
-        default_tags_before: bool = config.get("post")["defaults"].get("tags_before", True)
-
-        # If the default tags are just a string, wrap it in a list
-        if isinstance(default_tags, str):
-            default_tags = [default_tags]
-        default_tags = remove_falsey_items(default_tags)
-
-        # Order the default and specific are requested
-        if default_tags_before:
-            page_meta["tags"] = default_tags + page_meta["tags"]
-        else:
-            page_meta["tags"] = page_meta["tags"] + default_tags
-
-        # Prefix each tag with a hashtag to better indicate its purpose
-        page_meta["tags"] = [f"#{tag}" for tag in page_meta["tags"]]
-
-        # Create a container for the post reading stats
-        page_meta["wordcount"] = {}
-
-        # Generate the caption for the featured image for the post if the both exist
-        if page_meta.get("image") and page_meta.get("caption"):
-            page_meta["caption"] = current_app()["render"]["markdown"].render(page_meta["caption"])
-
-        # Store the meta info, both parsed and raw text
-        self.meta = page_meta
-        self.raw_meta = front_matter[0].content
+        self.meta = PostMeta.parse(self.raw_meta, name=self.file.name)
 
 
 class PostIndex(Page):
@@ -157,3 +288,45 @@ class PostIndex(Page):
     @property
     def template_name(self) -> str:
         return config.get("post")["index_template"]
+
+
+class TagIndex(Page):
+    """Represent the index page of the posts with a tag."""
+
+    @property
+    def template_name(self) -> str:
+        return config.get("post")["tag_template"]
+
+
+def read_posts(
+    files: list[Path], /, manifest: Manifest, low_memory: bool = False
+) -> tuple[dict[str, Post], dict[str, str]]:
+    """Read every post, newest first, along with a fingerprint of what each is made of.
+
+    The reading stats of a post are worked out while its content is at hand, unless
+    the `manifest` has them for the same source. To keep memory use down,
+    a post's content can be dropped until it's the post's turn to be rendered.
+    """
+    profiler = current_profiler()
+    posts: dict[str, Post] = {}
+    sources: dict[str, str] = {}
+    for file in files:
+        with profiler.post(file.name):
+            with profiler.stage("front_matter"):
+                post_model = Post(file)
+            source = sources[file.name] = content_hash(post_model.raw_meta + post_model.content)
+            # The stats kept from the last build are put back in order, which shows in the feeds
+            with profiler.stage("stats"):
+                entry = manifest.posts.get(file.name, {})
+                post_model.meta.stats = (
+                    {k: entry["stats"][k] for k in stats.FIELDS}
+                    if entry.get("source") == source and "stats" in entry
+                    else stats.read_stats(post_model.content)
+                )
+        if low_memory:
+            post_model.content = ""
+        posts[file.name] = post_model
+
+    # Sort all of the posts, with the newest on top
+    posts = {k: v for k, v in sorted(posts.items(), key=lambda x: x[1].meta.date, reverse=True)}
+    return posts, sources